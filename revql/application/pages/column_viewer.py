@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from revql.application.utils.db_connection import DatabaseConnection
-from revql.application.utils.db_utils import delete_empty_columns
+from revql.application.utils.cleanup_utils import delete_columns
 
 class ColumnViewer:
     def __init__(self, parent, db_path, table_name):
@@ -51,7 +51,13 @@ class ColumnViewer:
         db_path = self.db_path
 
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete the columns '{', '.join(column_names)}' from table '{self.table_name}'?"):
-            for item, column_name in zip(selected_items, column_names):
-                delete_empty_columns(db_path, self.table_name, column_name)
+            try:
+                # All selected columns are removed together, with at most one rewrite of the table
+                delete_columns(db_path, self.table_name, column_names)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to delete columns: {str(e)}")
+                return
+
+            for item in selected_items:
                 self.columns_tree.delete(item)
             messagebox.showinfo("Success", f"Columns '{', '.join(column_names)}' deleted successfully.")
\ No newline at end of file
@@ -5,7 +5,7 @@ from ..utils.tablesorter import TableSorter
 from ..relationmanagement.idrefactor import rename_id_columns_and_create_relations
 from ..utils.db_utils import delete_empty_columns, delete_empty_tables
 from ..utils.db_connection import DatabaseConnection
-from ..relationmanagement.projectmanagement import ensure_project_information_id
+from ..relationmanagement.projectmanagement import ensure_project_information_id, backfill_project_information_id
 import logging
 
 class RelationRatioViewer:
@@ -86,21 +86,12 @@ class RelationRatioViewer:
 
     def update_project_information_id(self):
         """Update ProjectInformation_id for new data."""
-        db = DatabaseConnection(self.db_path)
-        cursor = db.cursor
-        
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        for table in tables:
-            table_name = table[0]
-            if table_name in ['ProjectInformation', 'sqlite_sequence']:
-                continue
-                
-            try:
-                cursor.execute(f'UPDATE "{table_name}" SET "ProjectInformation_id" = (SELECT "ProjectInformation_id" FROM "ProjectInformation" ORDER BY "ProjectInformation_id" DESC LIMIT 1) WHERE "ProjectInformation_id" IS NULL')
-            except sqlite3.OperationalError as e:
-                logging.warning(f"Could not update ProjectInformation_id in {table_name}: {e}")
-        
-        db.commit()
-        db.close()
+        # The project id is resolved once and every table is filled in one transaction
+        try:
+            updated = backfill_project_information_id(self.db_path)
+        except sqlite3.Error as e:
+            logging.error(f"Error updating ProjectInformation_id: {e}")
+            messagebox.showerror("Error", f"Failed to update ProjectInformation_id: {str(e)}")
+            return
+        logging.info(f"ProjectInformation_id set in {len(updated)} tables")
         messagebox.showinfo("Success", "ProjectInformation_id updated for new data.")
\ No newline at end of file
@@ -1,10 +1,13 @@
 import tkinter as tk
 import sqlite3
+import queue
+import threading
 from tkinter import ttk, messagebox
 from ..utils.tablesorter import TableSorter
 from ..relationmanagement.idrefactor import rename_id_columns_and_create_relations
 from ..utils.db_utils import delete_empty_columns, delete_empty_tables
 from ..utils.db_connection import DatabaseConnection
+from ..utils.db_utils import check_matches_exactly
 import logging
 
 class RelationRatioViewer:
@@ -23,7 +26,7 @@ class RelationRatioViewer:
         self.frame.rowconfigure(0, weight=1)
 
         # Create treeview
-        columns = ["Table", "Column", "Matches Table", "Match Ratio", "Data Overlap %"]
+        columns = ["Table", "Column", "Matches Table", "Match Ratio", "Data Overlap %", "95% CI"]
         self.tree = ttk.Treeview(self.frame, columns=columns, show="headings")
         
         # Configure column headings
@@ -31,7 +34,7 @@ class RelationRatioViewer:
             self.tree.heading(col, text=col, 
                             command=lambda c=col: self._sort_treeview(self.tree, c, 
                                 data_type='numeric' if c in ["Match Ratio", "Data Overlap %"] else 'alphabetical'))
-            if col in ["Match Ratio", "Data Overlap %"]:
+            if col in ["Match Ratio", "Data Overlap %", "95% CI"]:
                 self.tree.column(col, width=100, anchor="center")
             else:
                 self.tree.column(col, width=150)
@@ -43,22 +46,108 @@ class RelationRatioViewer:
         self.tree.configure(yscroll=scrollbar.set)
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
 
+        self._populate_matches()
+
+        # Add buttons
+        self.create_relations_button = ttk.Button(self.frame, text="Create Relations", command=self.create_relations)
+        self.create_relations_button.grid(row=1, column=0, sticky=tk.W, pady=5)
+
+        self.exact_check_button = ttk.Button(self.frame, text="Check Selected Exactly", command=self.check_selected_exactly)
+        self.exact_check_button.grid(row=1, column=0, sticky=tk.E, pady=5)
+
+        self.close_button = ttk.Button(self.frame, text="Close", command=self.top.destroy)
+        self.close_button.grid(row=1, column=1, sticky=tk.E, pady=5)
+
+        # Status bar
+        self.status_var = tk.StringVar()
+        self.status_var.set("Ready")
+        status_bar = ttk.Label(self.frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        status_bar.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+
+        self._refresh_queue = None
+
+    def _populate_matches(self):
+        """Fill the tree with the current data matches."""
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+
         # Populate matches - only show data matches with high overlap
         if self.data_matches:  # Check if data_matches exists and is not empty
-            for table, column, match_table, ratio, overlap in self.data_matches:
-                if overlap >= 95:  # Only show matches with 95% or higher overlap
+            for table, column, match_table, ratio, overlap, *interval in self.data_matches:
+                if interval:
+                    # Sampled matches are shown while 95% lies within their confidence interval
+                    low, high = interval[0]
+                    if high >= 95:
+                        self.tree.insert("", "end",
+                            values=(table, column, match_table, f"{ratio:.2f}", f"{overlap:.2f}", f"{low:.1f}-{high:.1f}"))
+                elif overlap >= 95:  # Only show matches with 95% or higher overlap
                     self.tree.insert("", "end", 
-                        values=(table, column, match_table, f"{ratio:.2f}", f"{overlap:.2f}"))
+                        values=(table, column, match_table, f"{ratio:.2f}", f"{overlap:.2f}", "exact"))
 
         # Sort tree by data overlap initially
         self._sort_treeview(self.tree, "Data Overlap %", "numeric")
 
-        # Add buttons
-        self.create_relations_button = ttk.Button(self.frame, text="Create Relations", command=self.create_relations)
-        self.create_relations_button.grid(row=1, column=0, sticky=tk.W, pady=5)
+    def refresh_in_background(self, discover):
+        """
+        Run discover() on a worker thread and show its matches once it finishes.
 
-        self.close_button = ttk.Button(self.frame, text="Close", command=self.top.destroy)
-        self.close_button.grid(row=1, column=1, sticky=tk.E, pady=5)
+        The stored matches stay visible meanwhile. Creating relations is disabled
+        until the refresh is done, so it never acts on outdated matches.
+        """
+        self._refresh_queue = queue.Queue()
+        self.create_relations_button.config(state=tk.DISABLED)
+        self.status_var.set("Data changed since the last analysis, refreshing relationships...")
+
+        def worker():
+            try:
+                self._refresh_queue.put(("done", discover()))
+            except Exception as e:
+                logging.error(f"Error refreshing relationships: {e}")
+                self._refresh_queue.put(("error", e))
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.top.after(200, self._poll_refresh)
+
+    def _poll_refresh(self):
+        """Apply the background refresh result on the Tk thread once it is available."""
+        if not self.top.winfo_exists():
+            return
+
+        try:
+            status, result = self._refresh_queue.get_nowait()
+        except queue.Empty:
+            self.top.after(200, self._poll_refresh)
+            return
+
+        self.create_relations_button.config(state=tk.NORMAL)
+        if status == "error":
+            self.status_var.set(f"Refresh failed, showing the last stored results: {result}")
+            return
+
+        self.name_matches, self.data_matches = result
+        self._populate_matches()
+        self.status_var.set("Relationships are up to date")
+
+    def check_selected_exactly(self):
+        """Replace the selected (sampled) matches by their exact overlap, dropping those below 95%."""
+        selected = {tuple(self.tree.item(item, "values")[:3]) for item in self.tree.selection()}
+        if not selected:
+            messagebox.showinfo("No Selection", "Select the relationships to check exactly.")
+            return
+
+        to_check = [match for match in self.data_matches if tuple(match[:3]) in selected]
+        self.status_var.set(f"Checking {len(to_check)} relationships exactly...")
+        self.top.update_idletasks()
+
+        exact = {tuple(match[:3]): match for match in check_matches_exactly(self.db_path, to_check)}
+        rejected = [key for key, match in exact.items() if match[4] < 95]
+
+        # Keep the matches in place, confirmed ones with their exact overlap
+        self.data_matches = [exact.get(tuple(match[:3]), match) for match in self.data_matches
+                             if tuple(match[:3]) not in rejected]
+        self._populate_matches()
+        self.status_var.set(f"Checked {len(exact)} relationships exactly: "
+                            f"{len(exact) - len(rejected)} confirmed, {len(rejected)} rejected")
 
     def _sort_treeview(self, tree, column, data_type='alphabetical'):
         sorter = TableSorter(tree)
@@ -75,11 +164,18 @@ class RelationRatioViewer:
                                        "This will modify tables and create relationships. Continue?"):
                 return
 
-            # Step 1: Rename ID columns and create relationships
-            rename_id_columns_and_create_relations(self.db_path, self.data_matches)
+            sampled = [match for match in self.data_matches if len(match) > 5]
+            if sampled and not messagebox.askyesno("Estimated Matches",
+                                                   f"{len(sampled)} relationships are only estimated from a sample. "
+                                                   "Create them without an exact check?"):
+                return
+
+            # Step 1: Ensure the ProjectInformation table is usable and get the project id
+            project_id = self.prepare_project_information()
 
-            # Step 2: Ensure ProjectInformation_id exists and is updated in all tables
-            self.ensure_project_information_id()
+            # Step 2: Rename ID columns, create relationships and set ProjectInformation_id
+            # in all tables, with at most one rebuild per table
+            rename_id_columns_and_create_relations(self.db_path, self.data_matches, project_id=project_id)
 
             # Show success message
             messagebox.showinfo("Success", "Relationships and ProjectInformation_id have been successfully updated.")
@@ -96,8 +192,8 @@ class RelationRatioViewer:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
             raise
 
-    def ensure_project_information_id(self):
-        """Ensure ProjectInformation_id exists in all tables and is updated for ALL rows."""
+    def prepare_project_information(self):
+        """Ensure the ProjectInformation table has a ProjectInformation_id key and a row, and return its id."""
         db = DatabaseConnection(self.db_path)
         cursor = db.cursor
         
@@ -269,34 +365,9 @@ class RelationRatioViewer:
                 ''')
                 project_id = cursor.fetchone()[0]
             
-            # Step 4: Ensure ProjectInformation_id exists in all other tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            
-            for table in tables:
-                table_name = table[0]
-                if table_name in ['ProjectInformation', 'sqlite_sequence']:
-                    continue
-                    
-                cursor.execute(f'PRAGMA table_info("{table_name}");')
-                columns = cursor.fetchall()
-                column_names = [col[1].lower() for col in columns]
-        
-                # Add ProjectInformation_id column if it doesn't exist
-                if 'projectinformation_id' not in column_names:
-                    cursor.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "ProjectInformation_id" INTEGER')
-                    logging.info(f"Added ProjectInformation_id to table {table_name}")
-        
-                # Update ALL ProjectInformation_id values
-                cursor.execute(f'''
-                    UPDATE "{table_name}"
-                    SET "ProjectInformation_id" = ?
-                ''', (project_id,))
-                    
-                logging.info(f"Updated ALL ProjectInformation_id values in table {table_name}")
-        
             db.commit()
-            logging.info("Successfully ensured ProjectInformation_id in all tables and rows.")
+            logging.info(f"ProjectInformation is ready, using ProjectInformation_id {project_id}")
+            return project_id
         
         except sqlite3.Error as e:
             db.rollback()
@@ -304,5 +375,4 @@ class RelationRatioViewer:
             raise
             
         finally:
-            db.close()
-            messagebox.showinfo("Success", "ProjectInformation_id updated for ALL rows in all tables.")
\ No newline at end of file
+            db.close()
\ No newline at end of file
@@ -1,15 +1,20 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 from revql.application.utils.db_connection import DatabaseConnection
-from revql.application.utils.db_utils import get_table_data, count_tables, find_matching_table_column_names, get_table_data, count_tables
+from revql.application.utils.db_utils import get_table_data, count_tables, find_matching_table_column_names, get_table_data, count_tables, load_stored_matches
 from revql.application.utils.tablesorter import TableSorter
+from revql.application.utils.cleanup_utils import delete_columns
+from revql.application.utils.vacuum_utils import reclaim_space, vacuum_into
+from revql.application.utils.index_utils import drop_unused_relation_indexes
 from revql.application.pages.relationratioviewer import RelationRatioViewer
-from ..utils.dbmerger import DatabaseMerger
+from ..utils.dbmerger import DatabaseMerger, DatabaseCleaner
 from revql.application.relationmanagement.idrefactor import rename_id_columns_and_create_relations
 import logging
 from revql.application.utils.db_utils import find_matching_table_column_names
 import os
+import queue
 import sqlite3
+import threading
 
 class TableViewerApp:
     def __init__(self):
@@ -42,6 +47,18 @@ class TableViewerApp:
         self.merge_button = ttk.Button(self.frame, text="Merge Database", command=self.merge_database)
         self.merge_button.grid(row=0, column=5, sticky=tk.W)
 
+        self.clean_button = ttk.Button(self.frame, text="Clean Database", command=self.clean_database)
+        self.clean_button.grid(row=0, column=6, sticky=tk.W)
+
+        self.quick_scan_button = ttk.Button(self.frame, text="Quick Relations Scan", command=self.quick_scan_relationships)
+        self.quick_scan_button.grid(row=0, column=7, sticky=tk.W)
+
+        self.compact_button = ttk.Button(self.frame, text="Compact Copy", command=self.compact_copy)
+        self.compact_button.grid(row=0, column=8, sticky=tk.W)
+
+        self.drop_indexes_button = ttk.Button(self.frame, text="Drop Unused Indexes", command=self.drop_unused_indexes)
+        self.drop_indexes_button.grid(row=0, column=9, sticky=tk.W)
+
         self.columns = ("Table Name", "Row Count", "Column Count")
         self.tree = ttk.Treeview(self.frame, columns=self.columns, show="headings")
         self.tree.heading("Table Name", text="Table Name", command=lambda: self.sorter.sort_by_column("Table Name", False, 'alphabetical'))
@@ -83,12 +100,173 @@ class TableViewerApp:
             messagebox.showwarning("No Database", "Please select a database first.")
             return
         
-        matching_info = find_matching_table_column_names(db_path)
-        if matching_info:
+        # Open straight from the results of the last run, refreshing them only if the data changed
+        stored_info, is_current = load_stored_matches(db_path)
+        if stored_info is not None and any(stored_info):
+            viewer = RelationRatioViewer(self.root, stored_info, db_path)
+            if not is_current:
+                viewer.refresh_in_background(lambda: find_matching_table_column_names(db_path, workers=None))
+            return
+        if stored_info is not None and is_current:
+            messagebox.showinfo("No Matches", "No matching table-column names found.")
+            return
+
+        # Spread discovery across every available core
+        matching_info = find_matching_table_column_names(db_path, workers=None)
+        if any(matching_info):
             RelationRatioViewer(self.root, matching_info, db_path)
         else:
             messagebox.showinfo("No Matches", "No matching table-column names found.")
 
+    def quick_scan_relationships(self):
+        """Estimate relations from a sample of each column, for a first look at a new export."""
+        db_path = self.db_path_entry.get()
+        if not db_path:
+            messagebox.showwarning("No Database", "Please select a database first.")
+            return
+
+        matching_info = find_matching_table_column_names(db_path, mode='sample')
+        if any(matching_info):
+            RelationRatioViewer(self.root, matching_info, db_path)
+        else:
+            messagebox.showinfo("No Matches", "No matching table-column names found.")
+
+    def compact_copy(self):
+        """Write a compacted copy of the database with VACUUM INTO."""
+        db_path = self.db_path_entry.get()
+        if not db_path:
+            messagebox.showwarning("No Database", "Please select a database first.")
+            return
+
+        target_path = filedialog.asksaveasfilename(
+            title="Save Compacted Copy As",
+            defaultextension=".db",
+            filetypes=(("SQLite Database Files", "*.db"), ("All Files", "*.*"))
+        )
+        if not target_path:
+            return
+
+        try:
+            report = vacuum_into(db_path, target_path)
+            messagebox.showinfo("Success", f"Compacted copy saved to {target_path}.\n{report.summary()}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to write compacted copy: {str(e)}")
+            logging.error(f"Compacted copy error: {str(e)}", exc_info=True)
+
+    def drop_unused_indexes(self):
+        """Drop relation indexes that cannot narrow down any lookup, e.g. on single-project databases."""
+        db_path = self.db_path_entry.get()
+        if not db_path:
+            messagebox.showwarning("No Database", "Please select a database first.")
+            return
+
+        try:
+            dropped = drop_unused_relation_indexes(db_path)
+            if dropped:
+                messagebox.showinfo("Success", f"Dropped {len(dropped)} unused indexes:\n" + "\n".join(dropped))
+            else:
+                messagebox.showinfo("No Unused Indexes", "Every relation index is in use.")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to drop unused indexes: {str(e)}")
+            logging.error(f"Drop unused indexes error: {str(e)}", exc_info=True)
+
+    def clean_database(self):
+        """Delete empty tables and columns. Discovery no longer does this implicitly."""
+        db_path = self.db_path_entry.get()
+        if not db_path:
+            messagebox.showwarning("No Database", "Please select a database first.")
+            return
+
+        if not messagebox.askyesno("Confirm Cleanup",
+                                   "This will delete all empty tables and empty columns from the database. Continue?"):
+            return
+
+        # Returning freed pages shrinks the file; the first time this rewrites it once
+        reclaim = messagebox.askyesno("Reclaim Space",
+                                      "Also return the freed space to the file system, shrinking the database file?")
+
+        try:
+            # Space is reclaimed afterwards on a worker thread, so the window stays responsive
+            report = DatabaseCleaner.cleanup_database(db_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred during cleanup: {str(e)}")
+            logging.error(f"Database cleanup error: {str(e)}", exc_info=True)
+            return
+
+        if reclaim:
+            self.reclaim_in_background(db_path, report)
+        else:
+            messagebox.showinfo("Success", report.summary())
+        self.display_table_data()
+
+    def reclaim_in_background(self, db_path, report):
+        """
+        Return freed pages to the file system on a worker thread, showing progress and a Stop button.
+
+        Stopping leaves a consistent, partly compacted file that the next reclaim
+        continues. The first reclaim of a database switches it to incremental
+        auto-vacuum with one full VACUUM, which cannot be stopped.
+        """
+        progress_queue = queue.Queue()
+        stop = threading.Event()
+
+        top = tk.Toplevel(self.root)
+        top.title("Reclaiming Space")
+        status_var = tk.StringVar(value="Preparing the database for incremental vacuum...")
+        ttk.Label(top, textvariable=status_var, padding="10").grid(row=0, column=0, sticky=tk.W)
+        progress = ttk.Progressbar(top, length=300, mode='indeterminate')
+        progress.grid(row=1, column=0, padx=10)
+        progress.start()
+
+        def request_stop():
+            stop.set()
+            status_var.set("Stopping after the current step...")
+
+        ttk.Button(top, text="Stop", command=request_stop).grid(row=2, column=0, pady=10)
+        top.protocol("WM_DELETE_WINDOW", request_stop)
+        self.clean_button.config(state=tk.DISABLED)
+
+        def worker():
+            try:
+                vacuum = reclaim_space(db_path, should_stop=stop.is_set,
+                                       on_step=lambda done, total: progress_queue.put(("step", (done, total))))
+                progress_queue.put(("done", vacuum))
+            except Exception as e:
+                logging.error(f"Error reclaiming space: {e}", exc_info=True)
+                progress_queue.put(("error", e))
+
+        def poll():
+            finished = None
+            while finished is None and not progress_queue.empty():
+                status, result = progress_queue.get_nowait()
+                if status != "step":
+                    finished = (status, result)
+                    continue
+
+                done, total = result
+                if str(progress['mode']) == 'indeterminate':
+                    progress.stop()
+                    progress.config(mode='determinate', maximum=total)
+                progress['value'] = done
+                if not stop.is_set():
+                    status_var.set(f"Returned {done} of {total} free pages to the file system")
+
+            if finished is None:
+                self.root.after(200, poll)
+                return
+
+            top.destroy()
+            self.clean_button.config(state=tk.NORMAL)
+            status, result = finished
+            if status == "error":
+                messagebox.showerror("Error", f"Cleanup succeeded, but reclaiming space failed: {str(result)}")
+                return
+            report.vacuum = result
+            messagebox.showinfo("Success", report.summary())
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(200, poll)
+
     def browse_files(self):
         filename = filedialog.askopenfilename(
             initialdir="/",
@@ -614,11 +792,8 @@ class TableDataViewer:
             return
 
         try:
-            db = DatabaseConnection(self.db_path)
-            cursor = db.cursor
-            cursor.execute(f'ALTER TABLE "{self.table_name}" DROP COLUMN "{column_name}"')
-            db.commit()
-            db.close()
+            # Dropped in place when SQLite allows it, otherwise by rebuilding the table
+            delete_columns(self.db_path, self.table_name, [column_name])
             
             # Refresh the view
             self.refresh_data()
@@ -0,0 +1,220 @@
+import sys
+import logging
+import sqlite3
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Tuple
+from .columnsketch import ColumnSketch
+from .keysets import IntKeySet, key_sql, key_text, key_value_sql, normalize_key
+from .overlapsampling import DEFAULT_SAMPLE_SIZE, ColumnSample, sample_column_values
+
+# Default memory budget for cached column profiles (256 MB)
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+class ColumnProfileCache:
+    """
+    Per-run cache of column profiles used by relationship discovery.
+
+    Each column's distinct non-null values (or a fixed-size sketch of them) are
+    read once and shared across every comparison that needs them. Integer-like
+    columns are held as compact IntKeySets, other columns as sets of str.
+    Profiles are evicted least-recently-used first once the estimated memory use
+    exceeds the budget.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.cursor = cursor
+        self.memory_budget = memory_budget
+        self._profiles: "OrderedDict[Tuple[str, str, str], object]" = OrderedDict()
+        self._sizes: Dict[Tuple[str, str, str], int] = {}
+        self._table_columns: Dict[str, List[str]] = {}
+        self._primary_keys: Dict[str, List[str]] = {}
+        self._populated_columns: Dict[str, List[str]] = {}
+        self._has_rows: Dict[str, bool] = {}
+        self.memory_used = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_columns(self, table_name: str) -> List[str]:
+        """Return the column names of a table, reading the schema only once."""
+        if table_name not in self._table_columns:
+            self.cursor.execute(f'PRAGMA table_info("{table_name}");')
+            columns = self.cursor.fetchall()
+            self._table_columns[table_name] = [col[1] for col in columns]
+            self._primary_keys[table_name] = [col[1] for col in columns if col[5]]
+        return self._table_columns[table_name]
+
+    def has_rows(self, table_name: str) -> bool:
+        """True when the table holds at least one row, probed without counting them."""
+        if table_name not in self._has_rows:
+            self.cursor.execute(f'SELECT 1 FROM "{table_name}" LIMIT 1')
+            self._has_rows[table_name] = self.cursor.fetchone() is not None
+        return self._has_rows[table_name]
+
+    def get_populated_columns(self, table_name: str) -> List[str]:
+        """
+        Return the columns of a table that hold at least one non-null value.
+
+        Primary keys and ProjectInformation_id are always kept, matching what
+        delete_empty_columns would leave behind, so discovery sees the same
+        columns without the database being rewritten.
+        """
+        if table_name not in self._populated_columns:
+            columns = self.get_columns(table_name)
+            primary_keys = self._primary_keys[table_name]
+            populated = []
+            for column_name in columns:
+                if column_name in primary_keys or column_name == "ProjectInformation_id":
+                    populated.append(column_name)
+                    continue
+
+                self.cursor.execute(f'SELECT 1 FROM "{table_name}" WHERE "{column_name}" IS NOT NULL LIMIT 1')
+                if self.cursor.fetchone() is not None:
+                    populated.append(column_name)
+            self._populated_columns[table_name] = populated
+        return self._populated_columns[table_name]
+
+    def get_id_columns(self, table_name: str) -> List[str]:
+        """Return the populated columns of a table that look like ID columns."""
+        return [col for col in self.get_populated_columns(table_name)
+                if col.lower() == 'id' or col.lower().endswith('id')]
+
+    def get_distinct_values(self, table_name: str, column_name: str):
+        """Return the distinct non-null values of a column as an IntKeySet or a set of str."""
+        key = (table_name, column_name, 'values')
+        values = self._lookup(key)
+        if values is None:
+            values = self._load_distinct_values(table_name, column_name)
+            self._store(key, values)
+        return values
+
+    def _load_distinct_values(self, table_name: str, column_name: str):
+        """
+        Load a column's distinct values in a single pass over them.
+
+        The type of one value decides whether an IntKeySet is tried: columns that
+        start with text are read straight into a set of str. An integer-like load
+        that meets another value switches to str, reusing the keys read so far.
+        Values are held by their key (see keysets.normalize_key) either way.
+        """
+        self.cursor.execute(f'SELECT typeof("{column_name}") FROM "{table_name}" '
+                            f'WHERE "{column_name}" IS NOT NULL LIMIT 1')
+        row = self.cursor.fetchone()
+        if row is not None and row[0] not in ('integer', 'real'):
+            expression = key_sql(f'"{column_name}"')
+            self.cursor.execute(f'SELECT DISTINCT {expression} FROM "{table_name}" WHERE "{column_name}" IS NOT NULL')
+            return frozenset(row[0] for row in self.cursor)
+
+        # SQLite sorts INTEGER and REAL values numerically, ahead of TEXT and BLOB
+        self.cursor.execute(f'SELECT DISTINCT "{column_name}" FROM "{table_name}" WHERE "{column_name}" IS NOT NULL ORDER BY 1')
+        keys = array('q')
+        for row in self.cursor:
+            value = normalize_key(row[0])
+            if type(value) is not int:
+                # Numeric values come first, so the keys read so far are all of them
+                values = {str(key) for key in keys}
+                values.add(key_text(value))
+                values.update(key_text(row[0]) for row in self.cursor)
+                return frozenset(values)
+            # DISTINCT treats 1 and 1.0 as one value, so the keys are already unique
+            keys.append(value)
+        return IntKeySet(keys)
+
+    def stream_distinct_values(self, table_name: str, column_name: str) -> Tuple[int, Iterator]:
+        """
+        Return the number of distinct non-null values of a column and an iterator over them.
+
+        Served from the cache when the values are loaded. Otherwise one query
+        gives both, the count coming from a window over the DISTINCT result, so
+        the table is scanned once. Values are streamed by their key (see
+        keysets.key_value_sql) and counted the way get_distinct_values holds them.
+        """
+        cached = self._profiles.get((table_name, column_name, 'values'))
+        if cached is not None:
+            return len(cached), iter(cached)
+
+        expression = key_value_sql(f'"{column_name}"')
+        # A separate cursor lets the caller keep using the shared one while streaming
+        cursor = self.cursor.connection.cursor()
+        cursor.execute(f'SELECT COUNT(*) OVER (), value FROM '
+                       f'(SELECT DISTINCT {expression} AS value FROM "{table_name}" WHERE "{column_name}" IS NOT NULL)')
+        first = cursor.fetchone()
+        if first is None:
+            cursor.close()
+            return 0, iter(())
+        return first[0], self._stream_rows(cursor, first[1])
+
+    @staticmethod
+    def _stream_rows(cursor: sqlite3.Cursor, first) -> Iterator:
+        """Yield the first value and then the rest of a (count, value) result, closing the cursor at the end."""
+        try:
+            yield first
+            for row in cursor:
+                yield row[1]
+        finally:
+            cursor.close()
+
+    def get_sample(self, table_name: str, column_name: str, sample_size: int = DEFAULT_SAMPLE_SIZE) -> ColumnSample:
+        """Return a random sample of a column's non-null values, drawn by rowid."""
+        key = (table_name, column_name, 'sample')
+        sample = self._lookup(key)
+        if sample is None:
+            sample = sample_column_values(self.cursor, table_name, column_name, sample_size)
+            self._store(key, sample)
+        return sample
+
+    def get_sketch(self, table_name: str, column_name: str) -> ColumnSketch:
+        """
+        Return a fixed-size sketch of a column, built from its distinct values.
+
+        The values are loaded through get_distinct_values, so the exact check of
+        a candidate the sketch keeps finds them already cached.
+        """
+        key = (table_name, column_name, 'sketch')
+        sketch = self._lookup(key)
+        if sketch is None:
+            sketch = ColumnSketch.from_keys(self.get_distinct_values(table_name, column_name))
+            self._store(key, sketch)
+        return sketch
+
+    def clear(self) -> None:
+        """Drop every cached profile."""
+        self._profiles.clear()
+        self._sizes.clear()
+        self._table_columns.clear()
+        self._primary_keys.clear()
+        self._populated_columns.clear()
+        self._has_rows.clear()
+        self.memory_used = 0
+
+    def _lookup(self, key: Tuple[str, str, str]):
+        """Return a cached profile and mark it as recently used, or None."""
+        if key in self._profiles:
+            self.hits += 1
+            self._profiles.move_to_end(key)
+            return self._profiles[key]
+        self.misses += 1
+        return None
+
+    def _store(self, key: Tuple[str, str, str], profile) -> None:
+        """Cache a profile, evicting older profiles to stay within the memory budget."""
+        size = self._estimate_size(profile)
+        if size > self.memory_budget:
+            logging.debug(f"Profile for {key[0]}.{key[1]} ({size} bytes) exceeds the memory budget; not cached")
+            return
+
+        self._profiles[key] = profile
+        self._sizes[key] = size
+        self.memory_used += size
+
+        while self.memory_used > self.memory_budget:
+            old_key, _ = self._profiles.popitem(last=False)
+            self.memory_used -= self._sizes.pop(old_key)
+            logging.debug(f"Evicted profile for {old_key[0]}.{old_key[1]}")
+
+    @staticmethod
+    def _estimate_size(profile) -> int:
+        """Estimate the memory held by a profile in bytes."""
+        if isinstance(profile, (ColumnSketch, IntKeySet, ColumnSample)):
+            return profile.memory_size
+        return sys.getsizeof(profile) + sum(sys.getsizeof(value) for value in profile)
@@ -0,0 +1,100 @@
+import heapq
+from .keysets import INT64_MAX, INT64_MIN, IntKeySet, parse_int_key
+
+# Size of the 64-bit hash space used by the sketches
+HASH_SPACE = 1 << 64
+
+# Random odd 128-bit constants of the multiply-shift hash
+_MULTIPLIER = 0x9E3779B97F4A7C15F39CC0605CEDC835
+_INCREMENT = 0x6A09E667F3BCC908B2FB1366EA957D3E
+_MASK_64 = (1 << 64) - 1
+_MASK_128 = (1 << 128) - 1
+
+def hash_int(key: int) -> int:
+    """Hash a 64-bit integer key to 64 bits with multiply-shift."""
+    return (((key & _MASK_64) * _MULTIPLIER + _INCREMENT) & _MASK_128) >> 64
+
+def hash_key(key) -> int:
+    """
+    Hash a key of an IntKeySet or a set of str to 64 bits.
+
+    Keys that exact discovery treats as equal hash alike: the text of an
+    integer hashes as that integer. Other text goes through Python's own
+    string hash, so sketches are only comparable within one process.
+    """
+    if type(key) is str:
+        if key[:1].isdigit() or key[:1] == '-':
+            number = parse_int_key(key)
+            if number is not None and INT64_MIN <= number <= INT64_MAX:
+                return hash_int(number)
+        return hash_int(hash(key))
+    return hash_int(key)
+
+class ColumnSketch:
+    """
+    Bottom-k MinHash sketch of a column's distinct keys: the k smallest key hashes.
+
+    Built from the key set held by ColumnProfileCache, so it sees the same
+    values as exact discovery and knows their exact count.
+    """
+
+    def __init__(self, hashes, distinct_count: int, k: int = 256):
+        self.k = k
+        self.hashes = frozenset(hashes)
+        self.distinct_count = distinct_count
+
+    @classmethod
+    def from_keys(cls, keys, k: int = 256) -> "ColumnSketch":
+        """Build a sketch from an IntKeySet or a set of str."""
+        hash_function = hash_int if isinstance(keys, IntKeySet) else hash_key
+        return cls(heapq.nsmallest(k, map(hash_function, keys)), len(keys), k)
+
+    def __bool__(self):
+        return self.distinct_count > 0
+
+    @property
+    def is_exact(self) -> bool:
+        """True when the sketch holds every distinct value of the column."""
+        return len(self.hashes) >= self.distinct_count
+
+    @property
+    def horizon(self) -> int:
+        """Upper bound of the hash range this sketch covers completely."""
+        return HASH_SPACE if self.is_exact else max(self.hashes)
+
+    def cardinality(self) -> float:
+        """Number of distinct values in the column."""
+        return float(self.distinct_count)
+
+    @property
+    def memory_size(self) -> int:
+        """Approximate memory held by the sketch in bytes."""
+        return 96 * self.k
+
+    def compare(self, other: "ColumnSketch") -> "SketchEstimate":
+        """Estimate the overlap percentage between two columns."""
+        # Both sketches are complete samples of the hash range below the horizon
+        horizon = min(self.horizon, other.horizon)
+        sample_self = {hashed for hashed in self.hashes if hashed <= horizon}
+        sample_other = {hashed for hashed in other.hashes if hashed <= horizon}
+
+        smaller = min(len(sample_self), len(sample_other))
+        if not smaller:
+            return SketchEstimate(0.0, 0, exact=self.is_exact and other.is_exact)
+
+        overlap = len(sample_self & sample_other) / smaller * 100
+        return SketchEstimate(overlap, smaller, exact=self.is_exact and other.is_exact)
+
+class SketchEstimate:
+    """Estimated overlap percentage together with the sample size it is based on."""
+
+    def __init__(self, overlap: float, sample_size: int, exact: bool = False):
+        self.overlap = overlap
+        self.sample_size = sample_size
+        self.exact = exact
+
+    def is_near(self, threshold: float, margin: float, min_sample: int = 32) -> bool:
+        """Whether the estimate is close enough to threshold to warrant an exact check."""
+        if self.sample_size < min_sample and not self.exact:
+            return True
+        return self.overlap >= threshold - margin
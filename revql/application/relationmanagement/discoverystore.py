@@ -0,0 +1,278 @@
+import os
+import zlib
+import sqlite3
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from .relationdiscovery import DataMatch, PairKey
+
+# (schema_hash, row_count, max_rowid, content_hash)
+Fingerprint = Tuple[str, int, Optional[int], str]
+
+# Columns passed to one call of the row checksum function, below SQLite's argument limit
+CHECKSUM_COLUMNS_PER_CALL = 100
+
+def _row_checksum(*values) -> int:
+    """CRC32 of a row's values; summed per table, it changes when any value is updated."""
+    return zlib.crc32(repr(values).encode('utf-8'))
+
+class DiscoveryStore:
+    """
+    Sidecar store of relationship discovery results, kept next to the database.
+
+    Each table is fingerprinted by its schema, row count, highest rowid and a
+    hash of its content, which also catches in-place updates, and every
+    evaluated (column, table) pair is stored with its overlap. Later runs
+    only re-evaluate pairs where at least one side changed, and skip discovery
+    entirely when the database file has not been written to since the last run.
+    The results of the last run stay readable, for display, until the schema
+    of the database changes.
+    """
+
+    VERSION = 3
+
+    def __init__(self, db_path: str, read_only: bool = False):
+        self.db_path = db_path
+        self.store_path = self.sidecar_path(db_path)
+        if read_only:
+            # Fails instead of creating an empty store when there is none
+            uri = f"{Path(self.store_path).resolve().as_uri()}?mode=ro"
+            self._connection = sqlite3.connect(uri, uri=True)
+        else:
+            self._connection = sqlite3.connect(self.store_path)
+            self._ensure_schema()
+
+    @staticmethod
+    def sidecar_path(db_path: str) -> str:
+        """Path of the store kept next to a database."""
+        return f"{db_path}.revql"
+
+    def _ensure_schema(self) -> None:
+        """Create the store tables, discarding stores written by another version."""
+        cursor = self._connection.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version != self.VERSION:
+            for table in ('metadata', 'table_fingerprints', 'pair_results'):
+                cursor.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS "metadata" (
+                "key" TEXT PRIMARY KEY,
+                "value" TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS "table_fingerprints" (
+                "table_name" TEXT PRIMARY KEY,
+                "schema_hash" TEXT,
+                "row_count" INTEGER,
+                "max_rowid" INTEGER,
+                "content_hash" TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS "pair_results" (
+                "mode" TEXT,
+                "position" INTEGER,
+                "table_name" TEXT,
+                "column_name" TEXT,
+                "match_table" TEXT,
+                "id_column" TEXT,
+                "match_ratio" REAL,
+                "overlap" REAL,
+                PRIMARY KEY ("mode", "table_name", "column_name", "match_table", "id_column")
+            )
+        ''')
+        cursor.execute(f"PRAGMA user_version = {self.VERSION}")
+        self._connection.commit()
+
+    def file_signature(self) -> str:
+        """Return a cheap signature that changes whenever the database file is written."""
+        parts = []
+        for path in (self.db_path, f"{self.db_path}-wal"):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+
+        # The file change counter in the header is bumped by every write transaction
+        with open(self.db_path, 'rb') as db_file:
+            header = db_file.read(28)
+        if len(header) == 28:
+            parts.append(str(int.from_bytes(header[24:28], 'big')))
+
+        parts.append(str(self.schema_version()))
+        return '|'.join(parts)
+
+    def schema_version(self) -> int:
+        """Return the schema cookie of the database, which changes with every schema change."""
+        with open(self.db_path, 'rb') as db_file:
+            header = db_file.read(44)
+        return int.from_bytes(header[40:44], 'big') if len(header) == 44 else 0
+
+    def is_unchanged(self, mode: str) -> bool:
+        """True when the database has not been written to since the last run in this mode."""
+        row = self._connection.execute('SELECT "value" FROM "metadata" WHERE "key" = ?', (f"signature:{mode}",)).fetchone()
+        return row is not None and row[0] == self.file_signature()
+
+    @staticmethod
+    def content_hash(cursor: sqlite3.Cursor, table_name: str) -> str:
+        """
+        Checksum of every value in a table, with its rowid, in one scan.
+
+        Each row is hashed by a registered function and the row hashes are
+        summed in SQL, so no values are loaded into Python as a whole.
+        """
+        cursor.execute(f'PRAGMA table_info("{table_name}")')
+        column_names = [col[1] for col in cursor.fetchall()]
+        chunks = [column_names[start:start + CHECKSUM_COLUMNS_PER_CALL]
+                  for start in range(0, len(column_names), CHECKSUM_COLUMNS_PER_CALL)]
+
+        def checksum_query(key: str) -> str:
+            sums = ", ".join("SUM(revql_row_checksum({}))".format(
+                ", ".join([key] + [f'"{name}"' for name in chunk])) for chunk in chunks)
+            return f'SELECT {sums} FROM "{table_name}"'
+
+        try:
+            cursor.execute(checksum_query("rowid"))
+        except sqlite3.OperationalError:
+            # WITHOUT ROWID tables
+            cursor.execute(checksum_query("NULL"))
+        return hashlib.sha1(repr(cursor.fetchone()).encode('utf-8')).hexdigest()
+
+    def page_hashes(self, cursor: sqlite3.Cursor, table_names: List[str]) -> Dict[str, str]:
+        """
+        Hash the raw b-tree pages of each table, read straight from the database file.
+
+        A write to a table rewrites its pages, so the hash changes with any
+        update; the bytes are hashed in C, so this costs one read of the file.
+        Returns nothing when SQLite lacks the dbstat table or a write-ahead log
+        may hold newer pages than the file.
+        """
+        wal_path = f"{self.db_path}-wal"
+        if os.path.exists(wal_path) and os.path.getsize(wal_path) > 0:
+            return {}
+        try:
+            cursor.execute("SELECT name, pageno FROM dbstat")
+        except sqlite3.OperationalError:
+            return {}
+
+        wanted = set(table_names)
+        pages = sorted((pageno, name) for name, pageno in cursor.fetchall() if name in wanted)
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+
+        hashes = {}
+        with open(self.db_path, 'rb') as db_file:
+            for pageno, name in pages:
+                db_file.seek((pageno - 1) * page_size)
+                hashes.setdefault(name, hashlib.sha1()).update(db_file.read(page_size))
+        return {name: f"pages:{digest.hexdigest()}" for name, digest in hashes.items()}
+
+    def compute_fingerprints(self, cursor: sqlite3.Cursor, table_names: List[str]) -> Dict[str, Fingerprint]:
+        """
+        Fingerprint each table by schema, row count, highest rowid and content hash.
+
+        The content hash is taken from the table's pages where possible, and
+        only falls back to the per-row checksum for tables it cannot cover.
+        """
+        cursor.connection.create_function("revql_row_checksum", -1, _row_checksum, deterministic=True)
+        page_hashes = self.page_hashes(cursor, table_names)
+
+        fingerprints = {}
+        for table_name in table_names:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+            row = cursor.fetchone()
+            schema_hash = hashlib.sha1((row[0] or '').encode('utf-8')).hexdigest() if row else ''
+
+            cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
+            row_count = cursor.fetchone()[0]
+
+            try:
+                cursor.execute(f'SELECT MAX(rowid) FROM "{table_name}"')
+                max_rowid = cursor.fetchone()[0]
+            except sqlite3.OperationalError:
+                # WITHOUT ROWID tables
+                max_rowid = None
+
+            content_hash = page_hashes.get(table_name) or f"rows:{self.content_hash(cursor, table_name)}"
+            fingerprints[table_name] = (schema_hash, row_count, max_rowid, content_hash)
+        return fingerprints
+
+    def stale_tables(self, fingerprints: Dict[str, Fingerprint]) -> Set[str]:
+        """Return the tables whose fingerprint differs from the stored one."""
+        stored = {row[0]: tuple(row[1:]) for row in self._connection.execute(
+            'SELECT "table_name", "schema_hash", "row_count", "max_rowid", "content_hash" FROM "table_fingerprints"')}
+        return {name for name, fingerprint in fingerprints.items() if stored.get(name) != fingerprint}
+
+    def load_results(self, mode: str, fingerprints: Dict[str, Fingerprint]) -> Dict[PairKey, float]:
+        """Return the stored overlap of every pair whose tables are both unchanged."""
+        stale = self.stale_tables(fingerprints)
+        results = {}
+        for table_name, column_name, match_table, id_column, overlap in self._connection.execute('''
+            SELECT "table_name", "column_name", "match_table", "id_column", "overlap"
+            FROM "pair_results" WHERE "mode" = ?
+        ''', (mode,)):
+            if table_name in stale or match_table in stale:
+                continue
+            if table_name not in fingerprints or match_table not in fingerprints:
+                continue
+            results[(table_name, column_name, match_table, id_column)] = overlap
+
+        logging.info(f"Discovery store: {len(stale)} changed tables, {len(results)} reusable pairs")
+        return results
+
+    def load_matches(self, mode: str, threshold: float) -> List[DataMatch]:
+        """Return the stored data matches of the last run in this mode."""
+        return [tuple(row) for row in self._connection.execute('''
+            SELECT "table_name", "column_name", "match_table", "match_ratio", "overlap"
+            FROM "pair_results"
+            WHERE "mode" = ? AND "overlap" >= ?
+            ORDER BY "position"
+        ''', (mode, threshold))]
+
+    def load_latest(self, mode: str, threshold: float) -> Optional[List[DataMatch]]:
+        """
+        Return the stored data matches of the last run in this mode, even if the
+        data changed since, or None when nothing was stored for the current schema.
+        """
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            return None
+        row = self._connection.execute('SELECT "value" FROM "metadata" WHERE "key" = ?',
+                                       (f"schema_version:{mode}",)).fetchone()
+        if row is None or row[0] != str(self.schema_version()):
+            return None
+        return self.load_matches(mode, threshold)
+
+    def save(self, mode: str, fingerprints: Dict[str, Fingerprint],
+             evaluated: Dict[PairKey, Tuple[float, float]]) -> None:
+        """Replace the stored fingerprints and pair results with those of this run."""
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute('DELETE FROM "table_fingerprints"')
+            cursor.executemany('''
+                INSERT INTO "table_fingerprints" ("table_name", "schema_hash", "row_count", "max_rowid", "content_hash")
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(name, *fingerprint) for name, fingerprint in fingerprints.items()])
+
+            cursor.execute('DELETE FROM "pair_results" WHERE "mode" = ?', (mode,))
+            cursor.executemany('''
+                INSERT INTO "pair_results"
+                ("mode", "position", "table_name", "column_name", "match_table", "id_column", "match_ratio", "overlap")
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(mode, position, *key, match_ratio, overlap)
+                  for position, (key, (match_ratio, overlap)) in enumerate(evaluated.items())])
+
+            # Pair results of other modes were computed against the old fingerprints
+            cursor.execute('DELETE FROM "pair_results" WHERE "mode" != ?', (mode,))
+            cursor.execute('DELETE FROM "metadata" WHERE "key" LIKE \'signature:%\' OR "key" LIKE \'schema_version:%\'')
+            cursor.executemany('INSERT OR REPLACE INTO "metadata" ("key", "value") VALUES (?, ?)',
+                               [(f"signature:{mode}", self.file_signature()),
+                                (f"schema_version:{mode}", str(self.schema_version()))])
+            self._connection.commit()
+        except sqlite3.Error as e:
+            self._connection.rollback()
+            logging.warning(f"Could not save discovery results: {e}")
+
+    def close(self) -> None:
+        """Close the store connection."""
+        self._connection.close()
@@ -1,8 +1,11 @@
 import sqlite3
-import time
 import logging
 from revql.application.utils.db_connection import DatabaseConnection
-from typing import Dict, Set
+from typing import Dict, List, Optional, Set, Tuple
+from revql.application.utils.cleanup_utils import drop_columns
+from revql.application.utils.index_utils import create_relation_indexes
+from .projectmanagement import add_project_column
+from .keysets import key_sql
 
 class RenameTracker:
     def __init__(self):
@@ -16,134 +19,319 @@ class RenameTracker:
             self.renamed_columns[table] = set()
         self.renamed_columns[table].add(column)
 
-def execute_with_retry(db, sql, max_retries=3):
-    retries = 0
-    while retries < max_retries:
-        try:
-            db.cursor.execute(sql)
-            db.commit()
-            return
-        except sqlite3.Error as e:
-            retries += 1
-            time.sleep(0.5)
-            if retries >= max_retries:
-                raise e
-
-def rename_id_columns(db, tracker):
+class ForeignKeyLookups:
+    """
+    Indexed temporary lookup tables used to resolve foreign key values.
+
+    Each referenced table gets one temporary table mapping the key text of its
+    ID (see keysets.key_sql) to the ID itself, keyed by that text, so values
+    resolve exactly as discovery matched them, e.g. 5.0 to the id 5. Rows are resolved with a join on
+    the key, an index lookup, instead of a correlated subquery that compares
+    CAST values and scans the referenced table for every row.
     """
-    Rename the 'id' column in all tables to '<tablename>_id' without creating duplicate columns.
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+        self._lookups: Dict[str, str] = {}
+
+    def lookup_table(self, match_table: str) -> str:
+        """Return the temporary lookup table of match_table, building it on first use."""
+        if match_table not in self._lookups:
+            temp_name = f"_revql_fk_lookup_{len(self._lookups)}"
+            # The referenced table may not have had its 'id' renamed yet; both name the same values
+            self.cursor.execute(f'PRAGMA table_info("{match_table}")')
+            column_names = {col[1].lower(): col[1] for col in self.cursor.fetchall()}
+            id_column = column_names.get(f"{match_table.lower()}_id", column_names.get('id', f"{match_table}_id"))
+
+            id_key = key_sql(f'm."{id_column}"')
+            self.cursor.execute(f'DROP TABLE IF EXISTS temp."{temp_name}"')
+            self.cursor.execute(f'CREATE TEMP TABLE "{temp_name}" ("key" TEXT PRIMARY KEY, "id") WITHOUT ROWID')
+
+            # The first row per key wins, like the LIMIT 1 of the lookup it replaces
+            self.cursor.execute(f'''
+                INSERT OR IGNORE INTO temp."{temp_name}" ("key", "id")
+                SELECT {id_key}, m."{id_column}"
+                FROM main."{match_table}" m
+                WHERE m."{id_column}" IS NOT NULL
+                ORDER BY m.rowid
+            ''')
+            self._lookups[match_table] = temp_name
+        return self._lookups[match_table]
+
+    def drop(self) -> None:
+        """Drop every temporary lookup table."""
+        for temp_name in self._lookups.values():
+            try:
+                self.cursor.execute(f'DROP TABLE IF EXISTS temp."{temp_name}"')
+            except sqlite3.Error as e:
+                logging.warning(f"Could not drop temporary table {temp_name}: {e}")
+        self._lookups.clear()
+
+class TableMigration:
     """
-    cursor = db.cursor
+    Every schema change planned for one table in a pipeline run.
+
+    Collects the renamed ID column, dropped columns, new foreign key columns and
+    the ProjectInformation_id column, so they can be applied with a single
+    rebuild instead of one rebuild per step.
+    """
+
+    def __init__(self, table_name: str, columns):
+        self.table_name = table_name
+        self.columns = columns
+        self.renames: Dict[str, str] = {}
+        self.primary_key: Optional[str] = None
+        self.dropped: Set[str] = set()
+        # (fk_column, match_table, source_column); source_column is None when the column already exists
+        self.foreign_keys: List[Tuple[str, str, Optional[str]]] = []
+        self.add_project_column = False
+        self.project_id = None
+
+    @property
+    def referenced_tables(self) -> List[str]:
+        """Tables whose IDs this table's new foreign key columns are resolved against."""
+        return [match_table for _, match_table, source in self.foreign_keys if source is not None]
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """Renames and foreign key constraints can only be applied by rebuilding the table."""
+        return bool(self.renames or self.foreign_keys)
+
+def plan_table_migrations(cursor: sqlite3.Cursor, relations_by_table: Dict[str, List[Tuple[str, str]]],
+                          project_id=None, dropped_columns: Optional[Dict[str, List[str]]] = None,
+                          stamp_existing: bool = True) -> List[TableMigration]:
+    """Plan the changes of every table, without changing anything."""
+    dropped_columns = dropped_columns or {}
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+    table_names = [row[0] for row in cursor.fetchall()]
 
-    for table in tables:
-        table_name = table[0]
-        if table_name in ['sqlite_sequence', 'ProjectInformation']:
+    migrations = []
+    for table_name in table_names:
+        if table_name in ['ProjectInformation', 'sqlite_sequence'] or table_name.startswith('sqlite_'):
             continue
-            
+
         cursor.execute(f'PRAGMA table_info("{table_name}");')
         columns = cursor.fetchall()
-        existing_columns = {col[1].lower() for col in columns}
-        
-        # Check for existing tablename_id column
-        tablename_id_exists = f"{table_name.lower()}_id" in existing_columns
-        id_column_exists = 'id' in existing_columns
-        
-        # Skip if there's no 'id' column or if tablename_id already exists
-        if not id_column_exists or tablename_id_exists:
+        by_lower = {col[1].lower(): col[1] for col in columns}
+        migration = TableMigration(table_name, columns)
+
+        # Rename 'id' to '<tablename>_id', unless that column already exists
+        if 'id' in by_lower and f"{table_name.lower()}_id" not in by_lower:
+            migration.renames[by_lower['id']] = f"{table_name}_id"
+            migration.primary_key = f"{table_name}_id"
+
+        for column_name in dropped_columns.get(table_name, []):
+            if column_name in by_lower.values() and column_name not in migration.renames:
+                migration.dropped.add(column_name)
+
+        if 'projectinformation_id' not in by_lower:
+            migration.add_project_column = True
+        if migration.add_project_column or stamp_existing:
+            migration.project_id = project_id
+
+        # Source columns are replaced by '<match_table>_id' columns holding the resolved IDs
+        present = set(by_lower) | {name.lower() for name in migration.renames.values()}
+        for orig_column, match_table in relations_by_table.get(table_name, []):
+            source = by_lower.get(orig_column.lower())
+            fk_col = f"{match_table}_id"
+            if source is None:
+                continue
+            if source.lower() == fk_col.lower():
+                # Already named like the foreign key, so it only gains the constraint
+                if all(fk[0].lower() != fk_col.lower() for fk in migration.foreign_keys):
+                    migration.foreign_keys.append((source, match_table, None))
+                continue
+
+            # A source whose foreign key column already exists is kept, it has nowhere to go
+            if fk_col.lower() not in present:
+                migration.dropped.add(source)
+                migration.foreign_keys.append((fk_col, match_table, source))
+                present.add(fk_col.lower())
+
+        migrations.append(migration)
+
+    return migrations
+
+def unresolved_sources(cursor: sqlite3.Cursor, migration: TableMigration,
+                       lookup_names: Dict[str, Optional[str]]) -> Dict[str, int]:
+    """
+    Count, in one scan, the non-NULL values of each source column that resolve to no id.
+
+    Returns the sources with unresolved values and their counts; those sources
+    are kept next to their new foreign key column instead of being dropped.
+    """
+    sources = [(fk_col, source) for fk_col, _, source in migration.foreign_keys
+               if source is not None and source in migration.dropped]
+    if not sources:
+        return {}
+
+    counts = []
+    joins = []
+    for fk_col, source in sources:
+        lookup = lookup_names[fk_col]
+        if lookup is None:
+            counts.append(f'SUM(t."{source}" IS NOT NULL)')
+            continue
+        alias = f"k{len(joins)}"
+        counts.append(f'SUM(t."{source}" IS NOT NULL AND {alias}."id" IS NULL)')
+        source_key = key_sql(f't."{source}"')
+        joins.append(f'LEFT JOIN temp."{lookup}" {alias} ON {alias}."key" = {source_key}')
+
+    cursor.execute(f'''
+        SELECT {", ".join(counts)}
+        FROM "{migration.table_name}" t
+        {" ".join(joins)}
+    ''')
+    row = cursor.fetchone()
+    return {source: count for (_, source), count in zip(sources, row) if count}
+
+def apply_table_migration(cursor: sqlite3.Cursor, migration: TableMigration, lookups: ForeignKeyLookups) -> None:
+    """Apply the planned changes of one table, rebuilding it at most once."""
+    table_name = migration.table_name
+    project_params = {'project_id': migration.project_id}
+
+    if not migration.needs_rebuild:
+        if migration.dropped:
+            drop_columns(cursor, table_name, migration.dropped)
+        if migration.add_project_column:
+            add_project_column(cursor, table_name, migration.project_id)
+            logging.info(f"Added ProjectInformation_id to table {table_name}")
+        elif migration.project_id is not None:
+            cursor.execute(f'UPDATE "{table_name}" SET "ProjectInformation_id" = :project_id', project_params)
+        return
+
+    # Source columns are only dropped when every value resolved to an id
+    lookup_names = {}
+    for fk_col, match_table, source in migration.foreign_keys:
+        if source is None:
             continue
-            
-        # Create a new table with the renamed column
-        temp_table = f"{table_name}_temp"
-        column_defs = []
-        
-        for col in columns:
-            col_name = col[1]
-            col_type = col[2]
-            
-            if col_name.lower() == 'id':
-                new_col_name = f"{table_name}_id"
-                column_defs.append(f'"{new_col_name}" {col_type} PRIMARY KEY')
-            else:
-                column_defs.append(f'"{col_name}" {col_type}')
-        
         try:
-            # Create the temporary table
-            cursor.execute(f'''
-                CREATE TABLE "{temp_table}" (
-                    {', '.join(column_defs)}
-                );
-            ''')
-            
-            # Copy data from the old table to the new table
-            old_columns = [col[1] for col in columns]
-            new_columns = [f"{table_name}_id" if col.lower() == 'id' else col for col in old_columns]
-            
-            # Ensure column names are properly quoted
-            quoted_old_columns = [f'"{col}"' for col in old_columns]
-            quoted_new_columns = [f'"{col}"' for col in new_columns]
-            
-            cursor.execute(f'''
-                INSERT INTO "{temp_table}" ({', '.join(quoted_new_columns)})
-                SELECT {', '.join(quoted_old_columns)}
-                FROM "{table_name}";
-            ''')
-            
-            # Replace the old table with the new table
-            cursor.execute(f'DROP TABLE "{table_name}";')
-            cursor.execute(f'ALTER TABLE "{temp_table}" RENAME TO "{table_name}";')
-            
-            db.commit()
-            tracker.track_rename(table_name, f"{table_name}_id")
-            logging.info(f"Renamed 'id' to '{table_name}_id' in table '{table_name}'")
-            
+            lookup_names[fk_col] = lookups.lookup_table(match_table)
         except sqlite3.OperationalError as e:
-            logging.warning(f"Could not rename 'id' in table '{table_name}': {e}")
-            cursor.execute(f'DROP TABLE IF EXISTS "{temp_table}";')
-            db.commit()
+            logging.warning(f"Cannot resolve {table_name}.{source} against {match_table}: {e}")
+            lookup_names[fk_col] = None
+    kept = unresolved_sources(cursor, migration, lookup_names)
+    for source, count in kept.items():
+        logging.warning(f"Keeping {table_name}.{source}: {count} values do not resolve to an id")
+
+    pk_columns = [col[1] for col in migration.columns if col[5]]
+    col_defs = []
+    new_cols = []
+    old_cols = []
+    plain_cols = []
+    joins = []
+    fk_defs = []
+
+    for col in migration.columns:
+        col_name, col_type = col[1], col[2]
+        if col_name in migration.dropped and col_name not in kept:
+            continue
+
+        new_name = migration.renames.get(col_name, col_name)
+        definition = f'"{new_name}" {col_type}'
+        if new_name == migration.primary_key or (migration.primary_key is None and pk_columns == [col_name]):
+            definition += ' PRIMARY KEY'
+        col_defs.append(definition)
+        new_cols.append(f'"{new_name}"')
+
+        if col_name.lower() == 'projectinformation_id' and migration.project_id is not None:
+            old_cols.append(':project_id')
+        else:
+            old_cols.append(f't."{col_name}"')
+        plain_cols.append(old_cols[-1])
+
+    if migration.add_project_column:
+        col_defs.append('"ProjectInformation_id" INTEGER')
+        new_cols.append('"ProjectInformation_id"')
+        old_cols.append(':project_id')
+        plain_cols.append(':project_id')
+
+    # Foreign key values are resolved through indexed joins
+    for fk_col, match_table, source in migration.foreign_keys:
+        fk_defs.append(f'FOREIGN KEY("{fk_col}") REFERENCES "{match_table}"("{match_table}_id")')
+        if source is None:
+            continue
+
+        col_defs.append(f'"{fk_col}" INTEGER')
+        new_cols.append(f'"{fk_col}"')
+        plain_cols.append("NULL")
+        lookup = lookup_names[fk_col]
+        if lookup is None:
+            old_cols.append("NULL")
+            continue
+        alias = f"k{len(joins)}"
+        old_cols.append(f'{alias}."id"')
+        source_key = key_sql(f't."{source}"')
+        joins.append(f'LEFT JOIN temp."{lookup}" {alias} ON {alias}."key" = {source_key}')
+
+    # Add ProjectInformation foreign key
+    fk_defs.append('FOREIGN KEY("ProjectInformation_id") REFERENCES "ProjectInformation"("ProjectInformation_id")')
+
+    temp_table = f"{table_name}_temp"
+    cursor.execute(f'DROP TABLE IF EXISTS "{temp_table}"')
+    cursor.execute(f'''
+        CREATE TABLE "{temp_table}" (
+            {", ".join(col_defs + fk_defs)}
+        )
+    ''')
+
+    try:
+        cursor.execute(f'''
+            INSERT INTO "{temp_table}" ({", ".join(new_cols)})
+            SELECT {", ".join(old_cols)}
+            FROM "{table_name}" t
+            {" ".join(joins)}
+        ''', project_params)
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Error inserting data for {table_name}: {e}")
+        if any(source in migration.dropped and source not in kept for _, _, source in migration.foreign_keys):
+            # The dropped source values would be lost with empty foreign keys
+            raise
+        # Fall back to simple copy, leaving the foreign keys empty
+        cursor.execute(f'''
+            INSERT INTO "{temp_table}" ({", ".join(new_cols)})
+            SELECT {", ".join(plain_cols)}
+            FROM "{table_name}" t
+        ''', project_params)
+
+    cursor.execute(f'DROP TABLE "{table_name}"')
+    cursor.execute(f'ALTER TABLE "{temp_table}" RENAME TO "{table_name}"')
+
+    for old_name, new_name in migration.renames.items():
+        logging.info(f"Renamed '{old_name}' to '{new_name}' in table '{table_name}'")
+    if migration.foreign_keys:
+        logging.info(f"Created foreign key constraints for {table_name}")
+
+def rename_id_columns_and_create_relations(db_path: str, matching_info, project_id=None,
+                                           dropped_columns: Optional[Dict[str, List[str]]] = None,
+                                           stamp_existing: bool = True):
+    """
+    Rename ID columns, add ProjectInformation_id and create foreign keys for the detected relations.
 
-def rename_id_columns_and_create_relations(db_path: str, matching_info):
+    All changes to a table are planned first and applied together, so each
+    table is rebuilt at most once. When project_id is given, it is written to
+    ProjectInformation_id of every row, or with stamp_existing=False only to
+    tables that did not have the column yet. dropped_columns, by table, are
+    removed in the same pass. The whole run is one transaction; each table
+    gets a savepoint, so a table that fails is rolled back on its own.
+    """
     db = DatabaseConnection(db_path)
     tracker = RenameTracker()
 
     try:
-        # Step 1: Rename id columns & add primary keys where needed
-        rename_id_columns(db, tracker)
-        
-        # Step 2: Ensure "DisciplineModel" column exists in ProjectInformation
         cursor = db.cursor
+
+        # Every step runs in one transaction, committed once; DDL does not open one implicitly
+        cursor.execute("BEGIN")
+
+        # Step 1: Ensure "DisciplineModel" column exists in ProjectInformation
         cursor.execute('PRAGMA table_info("ProjectInformation");')
         cols = [col[1].lower() for col in cursor.fetchall()]
-        if 'disciplinemodel' not in cols:
+        if cols and 'disciplinemodel' not in cols:
             cursor.execute('ALTER TABLE "ProjectInformation" ADD COLUMN "DisciplineModel" TEXT')
             logging.info('Added column "DisciplineModel" to table "ProjectInformation".')
-        db.commit()
-        
-        # Step 3: Add ProjectInformation_id to tables that don't have it
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        
-        for table in tables:
-            table_name = table[0]
-            if table_name in ['ProjectInformation', 'sqlite_sequence']:
-                continue
-                
-            cursor.execute(f'PRAGMA table_info("{table_name}");')
-            columns = cursor.fetchall()
-            column_names = [col[1].lower() for col in columns]
-            
-            # Only add ProjectInformation_id if it doesn't exist
-            if 'projectinformation_id' not in column_names:
-                try:
-                    cursor.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "ProjectInformation_id" INTEGER')
-                    logging.info(f"Added ProjectInformation_id to table {table_name}")
-                except sqlite3.OperationalError as e:
-                    logging.warning(f"Could not add ProjectInformation_id to {table_name}: {e}")
-        
-        db.commit()
         
-        # Step 4: Group detected relations by source table
+        # Step 2: Group detected relations by source table
         relations_by_table = {}
         for match in matching_info:
             if len(match) < 3:
@@ -153,126 +341,46 @@ def rename_id_columns_and_create_relations(db_path: str, matching_info):
                 continue
             relations_by_table.setdefault(table_name, []).append((column_name, match_table))
         
-        # Step 5: Create foreign key relationships
-        for table in tables:
-            table_name = table[0]
-            if table_name in ['ProjectInformation', 'sqlite_sequence'] or table_name not in relations_by_table:
-                continue
-                
-            try:
-                # Get current table structure
-                cursor.execute(f'PRAGMA table_info("{table_name}");')
-                columns = cursor.fetchall()
-                column_dict = {col[1].lower(): col for col in columns}
-                
-                # Create new table with foreign keys
-                temp_table = f"{table_name}_temp"
-                cursor.execute(f'DROP TABLE IF EXISTS "{temp_table}"')
-                
-                # Build column definitions for new table
-                col_defs = []
-                
-                # Add original columns first (except those that will be replaced with FKs)
-                for col in columns:
-                    col_name = col[1]
-                    skip_column = False
-                    
-                    # Skip columns that will be replaced with foreign keys
-                    for orig_col, _ in relations_by_table[table_name]:
-                        if col_name.lower() == orig_col.lower():
-                            skip_column = True
-                            break
-                            
-                    if not skip_column:
-                        col_defs.append(f'"{col_name}" {col[2]}')
-                
-                # Add foreign key columns
-                fk_defs = []
-                for orig_column, match_table in relations_by_table[table_name]:
-                    fk_col = f"{match_table}_id"
-                    
-                    # Only add if not already in the table
-                    if fk_col.lower() not in column_dict:
-                        col_defs.append(f'"{fk_col}" INTEGER')
-                        fk_defs.append(f'FOREIGN KEY("{fk_col}") REFERENCES "{match_table}"("{match_table}_id")')
-                
-                # Add ProjectInformation foreign key
-                if 'projectinformation_id' in column_dict:
-                    fk_defs.append('FOREIGN KEY("ProjectInformation_id") REFERENCES "ProjectInformation"("ProjectInformation_id")')
-                
-                # Create the new table
-                create_sql = f'''
-                    CREATE TABLE "{temp_table}" (
-                        {", ".join(col_defs + fk_defs)}
-                    )
-                '''
-                cursor.execute(create_sql)
-                
-                # Copy data from old table to new table
-                # Prepare column lists for old and new tables
-                old_cols = []
-                new_cols = []
-                
-                for col in columns:
-                    col_name = col[1]
-                    skip_column = False
-                    
-                    # Skip columns that will be replaced with foreign keys
-                    for orig_col, _ in relations_by_table[table_name]:
-                        if col_name.lower() == orig_col.lower():
-                            skip_column = True
-                            break
-                            
-                    if not skip_column:
-                        old_cols.append(f'"{col_name}"')
-                        new_cols.append(f'"{col_name}"')
-                
-                # Add foreign key lookups
-                for orig_column, match_table in relations_by_table[table_name]:
-                    fk_col = f"{match_table}_id"
-                    if fk_col.lower() not in column_dict:
-                        # Add FK lookup to the SELECT part
-                        new_cols.append(f'"{fk_col}"')
-                        old_cols.append(f'''(
-                            SELECT m."{match_table}_id" 
-                            FROM "{match_table}" m 
-                            WHERE CAST(m."{match_table}_id" AS TEXT) = CAST(t."{orig_column}" AS TEXT) 
-                            LIMIT 1
-                        )''')
-                
-                # Insert data
-                insert_sql = f'''
-                    INSERT INTO "{temp_table}" ({", ".join(new_cols)})
-                    SELECT {", ".join(old_cols)}
-                    FROM "{table_name}" t
-                '''
-                
+        # Step 3: Plan every change per table, then apply each table's changes at once
+        migrations = plan_table_migrations(cursor, relations_by_table, project_id, dropped_columns, stamp_existing)
+        lookups = ForeignKeyLookups(cursor)
+        for migration in migrations:
+            table_name = migration.table_name
+
+            # Lookups are built outside the table's savepoint, so rolling back the table keeps them
+            for match_table in migration.referenced_tables:
                 try:
-                    cursor.execute(insert_sql)
-                except sqlite3.OperationalError as e:
-                    logging.warning(f"Error inserting data for {table_name}: {e}")
-                    # Fall back to simple copy
-                    cursor.execute(f'''
-                        INSERT INTO "{temp_table}" ({", ".join(new_cols)})
-                        SELECT {", ".join([col for col in old_cols if "SELECT" not in col])}
-                        FROM "{table_name}"
-                    ''')
-                
-                # Replace old table with new table
-                cursor.execute(f'DROP TABLE "{table_name}"')
-                cursor.execute(f'ALTER TABLE "{temp_table}" RENAME TO "{table_name}"')
-                db.commit()
-                
-                logging.info(f"Created foreign key constraints for {table_name}")
-                
-            except sqlite3.OperationalError as e:
-                logging.warning(f"Error creating foreign keys for {table_name}: {e}")
-                cursor.execute(f'DROP TABLE IF EXISTS "{temp_table}"')
-                db.commit()
+                    lookups.lookup_table(match_table)
+                except sqlite3.OperationalError:
+                    pass  # Reported when the table is migrated
+
+            # A failed table is rolled back to its savepoint, leaving the other tables' changes
+            cursor.execute("SAVEPOINT migrate_table")
+            try:
+                apply_table_migration(cursor, migration, lookups)
+                cursor.execute("RELEASE SAVEPOINT migrate_table")
+                for new_name in migration.renames.values():
+                    tracker.track_rename(table_name, new_name)
+            except sqlite3.Error as e:
+                # Constraint failures, such as duplicate IDs, only abort this table too
+                logging.warning(f"Error migrating table {table_name}: {e}")
+                cursor.execute("ROLLBACK TO SAVEPOINT migrate_table")
+                cursor.execute("RELEASE SAVEPOINT migrate_table")
+
+        lookups.drop()
+
+        # Step 4: Index the new foreign key and ProjectInformation_id columns
+        index_reports = create_relation_indexes(cursor)
+
+        db.commit()
+        if index_reports:
+            logging.info(f"Created {len(index_reports)} relation indexes in "
+                         f"{sum(report.seconds for report in index_reports):.2f}s, "
+                         f"{sum(report.size for report in index_reports) / 1024:.1f} KB")
     
     except Exception as e:
         db.rollback()
         logging.error(f"Error in rename_id_columns_and_create_relations: {e}")
         raise
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,117 @@
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterator
+
+class IntKeySet:
+    """
+    Sorted, de-duplicated 64-bit integer keys held in a compact array('q').
+
+    Used for integer-like ID columns, which take 8 bytes per value here instead
+    of a Python set of str. Values are compared numerically.
+    """
+
+    def __init__(self, keys: array):
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.keys)
+
+    def __contains__(self, value) -> bool:
+        if isinstance(value, str):
+            value = parse_int_key(value)
+            if value is None:
+                return False
+        position = bisect_left(self.keys, value)
+        return position < len(self.keys) and self.keys[position] == value
+
+    @property
+    def memory_size(self) -> int:
+        """Memory held by the key set in bytes."""
+        return sys.getsizeof(self.keys)
+
+    def intersection_size(self, other: "IntKeySet") -> int:
+        """Count the keys present in both sets with a sorted merge."""
+        small, large = (self.keys, other.keys) if len(self.keys) <= len(other.keys) else (other.keys, self.keys)
+        count = 0
+        low = 0
+        large_size = len(large)
+        for value in small:
+            # Both arrays are sorted, so the search window only moves forward
+            low = bisect_left(large, value, low)
+            if low == large_size:
+                break
+            if large[low] == value:
+                count += 1
+        return count
+
+# Range of SQLite INTEGER values, which an IntKeySet holds
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+def normalize_key(value):
+    """
+    Return the key a column value is compared by: whole REAL values become INTEGER.
+
+    Every overlap mode and the foreign key lookups use this one rule, so 5.0
+    matches the id 5 wherever a relation is found or resolved.
+    """
+    if type(value) is float and value.is_integer() and INT64_MIN <= value <= INT64_MAX:
+        return int(value)
+    return value
+
+def key_text(value) -> str:
+    """Text form of a value's key, as held in the str key sets."""
+    return str(normalize_key(value))
+
+def key_sql(expression: str) -> str:
+    """SQL computing key_text of a column expression inside SQLite."""
+    return (f"CASE WHEN typeof({expression}) = 'real' AND {expression} = CAST({expression} AS INTEGER) "
+            f"THEN CAST(CAST({expression} AS INTEGER) AS TEXT) ELSE CAST({expression} AS TEXT) END")
+
+def key_value_sql(expression: str) -> str:
+    """
+    SQL computing a column expression's key as a value: INTEGER for whole numbers
+    and the canonical text of an integer, key_sql text otherwise.
+
+    Values with equal key_text get equal results, so DISTINCT over it counts
+    keys, while integer keys come back as int for IntKeySet lookups.
+    """
+    return (f"CASE WHEN typeof({expression}) = 'integer' THEN {expression} "
+            f"WHEN typeof({expression}) = 'real' AND {expression} = CAST({expression} AS INTEGER) "
+            f"THEN CAST({expression} AS INTEGER) "
+            f"WHEN typeof({expression}) = 'text' AND CAST(CAST({expression} AS INTEGER) AS TEXT) = {expression} "
+            f"THEN CAST({expression} AS INTEGER) ELSE CAST({expression} AS TEXT) END")
+
+def parse_int_key(value: str):
+    """Return the integer a string spells in canonical form, or None."""
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    return number if str(number) == value else None
+
+def contains_key(keys, value) -> bool:
+    """Test a raw column value for membership in a key set of either representation."""
+    if isinstance(keys, IntKeySet):
+        value = normalize_key(value)
+        if type(value) not in (int, str):
+            return False
+        return value in keys
+    return key_text(value) in keys
+
+def intersection_size(set1, set2) -> int:
+    """Count the values present in both key sets, whichever representation they use."""
+    if isinstance(set1, IntKeySet) and isinstance(set2, IntKeySet):
+        return set1.intersection_size(set2)
+    if not isinstance(set1, IntKeySet) and not isinstance(set2, IntKeySet):
+        return len(set1 & set2)
+
+    # Mixed representations: probe the larger set with each value of the smaller one
+    small, large = (set1, set2) if len(set1) <= len(set2) else (set2, set1)
+    if isinstance(large, IntKeySet):
+        return sum(1 for value in small if value in large)
+    return sum(1 for value in small if str(value) in large)
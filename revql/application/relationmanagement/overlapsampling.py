@@ -0,0 +1,164 @@
+import sys
+import math
+import random
+import sqlite3
+from collections import Counter
+from typing import List, Tuple
+from .keysets import contains_key, key_text
+
+# Number of non-null values sampled from each source column
+DEFAULT_SAMPLE_SIZE = 200
+
+# Rowids looked up per query, kept well below SQLite's bound parameter limit
+ROWID_BATCH_SIZE = 500
+
+# Rounds of rowid draws before giving up on sparse columns
+MAX_SAMPLE_ROUNDS = 8
+
+# z score of the two-sided 95% confidence interval
+CONFIDENCE_Z = 1.96
+
+class ColumnSample:
+    """Sampled non-null values of a column, with the estimated number of non-null rows."""
+
+    def __init__(self, values: List, population: float, complete: bool = False):
+        self.values = values
+        self.population = population
+        self.complete = complete
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def memory_size(self) -> int:
+        """Memory held by the sample in bytes."""
+        return sys.getsizeof(self.values) + sum(sys.getsizeof(value) for value in self.values)
+
+def sample_column_values(cursor: sqlite3.Cursor, table_name: str, column_name: str,
+                         sample_size: int = DEFAULT_SAMPLE_SIZE) -> ColumnSample:
+    """
+    Draw a random sample of the non-null values of a column by looking up random rowids.
+
+    Each lookup is a rowid seek, so the cost does not depend on the table size.
+    The sample is seeded by table and column name, so repeated runs see the same rows.
+    """
+    try:
+        cursor.execute(f'SELECT MIN(rowid), MAX(rowid) FROM "{table_name}"')
+    except sqlite3.OperationalError:
+        # WITHOUT ROWID tables have no rowids to draw from
+        cursor.execute(f'SELECT COUNT("{column_name}") FROM "{table_name}"')
+        population = cursor.fetchone()[0]
+        cursor.execute(f'''
+            SELECT "{column_name}" FROM "{table_name}"
+            WHERE "{column_name}" IS NOT NULL
+            ORDER BY RANDOM() LIMIT ?
+        ''', (sample_size,))
+        values = [row[0] for row in cursor.fetchall()]
+        return ColumnSample(values, population, len(values) == population)
+
+    low, high = cursor.fetchone()
+    if low is None:
+        return ColumnSample([], 0, True)
+
+    span = high - low + 1
+    rng = random.Random(f"{table_name}.{column_name}")
+    drawn = set()
+    values = []
+    for _ in range(MAX_SAMPLE_ROUNDS):
+        remaining = span - len(drawn)
+        if remaining <= 0 or len(values) >= sample_size:
+            break
+
+        # Draw more rowids than needed to make up for gaps and null values
+        batch = []
+        wanted = min(remaining, max(ROWID_BATCH_SIZE, 2 * (sample_size - len(values))))
+        while len(batch) < wanted:
+            rowid = rng.randint(low, high)
+            if rowid not in drawn:
+                drawn.add(rowid)
+                batch.append(rowid)
+
+        for start in range(0, len(batch), ROWID_BATCH_SIZE):
+            chunk = batch[start:start + ROWID_BATCH_SIZE]
+            cursor.execute(f'''
+                SELECT "{column_name}" FROM "{table_name}"
+                WHERE rowid IN ({", ".join("?" * len(chunk))}) AND "{column_name}" IS NOT NULL
+            ''', chunk)
+            values.extend(row[0] for row in cursor.fetchall())
+
+    # Non-null rows are estimated from the share of drawn rowids that held a value
+    population = span * len(values) / len(drawn) if drawn else 0
+    complete = len(drawn) == span
+    if len(values) > sample_size:
+        values = rng.sample(values, sample_size)
+        complete = False
+    return ColumnSample(values, population, complete)
+
+def wilson_interval(hits: int, sample_size: int, z: float = CONFIDENCE_Z) -> Tuple[float, float]:
+    """Wilson score interval of a sampled proportion, in percent."""
+    if not sample_size:
+        return 0.0, 100.0
+
+    p = hits / sample_size
+    denominator = 1 + z * z / sample_size
+    center = (p + z * z / (2 * sample_size)) / denominator
+    spread = z * math.sqrt(p * (1 - p) / sample_size + z * z / (4 * sample_size * sample_size)) / denominator
+    return max(0.0, center - spread) * 100, min(1.0, center + spread) * 100
+
+class SampledOverlap:
+    """
+    Overlap estimated from a sample of source rows, with its confidence interval.
+
+    Like get_overlap_percentage, the overlap is the share of distinct values
+    found in the target, relative to the smaller side. The share of distinct
+    sampled values found in the target gets a Wilson interval. It is scaled
+    up when the target holds fewer distinct values than the column, whose
+    distinct count lies between the Chao1 estimate from the sampled value
+    frequencies and its estimated number of non-null rows.
+    """
+
+    def __init__(self, hits: int, distinct: int, distinct_range: Tuple[float, float], target_count: int,
+                 sample_size: int):
+        self.hits = hits
+        self.sample_size = sample_size
+        self.distinct_range = distinct_range
+
+        if not distinct:
+            self.overlap = self.low = self.high = 0.0
+            return
+
+        low, high = wilson_interval(hits, distinct)
+        share = (hits / distinct) * 100
+        fewest, most = distinct_range
+        self.overlap = min(100.0, share * self._scale(fewest, target_count))
+        self.low = min(100.0, low * self._scale(fewest, target_count))
+        self.high = min(100.0, high * self._scale(most, target_count))
+
+    @staticmethod
+    def _scale(column_count: float, target_count: int) -> float:
+        """Factor from the share of column values found to the share of the smaller side."""
+        smaller = min(column_count, target_count)
+        return column_count / smaller if smaller else 0.0
+
+    @classmethod
+    def from_sample(cls, sample: ColumnSample, id_data) -> "SampledOverlap":
+        """Test each distinct sampled value for membership in the target's key set."""
+        # Values are told apart by their key, like the distinct values of exact mode
+        counts = Counter(key_text(value) for value in sample.values)
+        hits = sum(1 for value in counts if contains_key(id_data, value))
+
+        if sample.complete:
+            distinct_range = (len(counts), len(counts))
+        else:
+            # Values seen once or twice hint at how many values the sample missed
+            singletons = sum(1 for count in counts.values() if count == 1)
+            doubletons = sum(1 for count in counts.values() if count == 2)
+            chao1 = len(counts) + singletons * (singletons - 1) / (2 * (doubletons + 1))
+            most = max(len(counts), sample.population)
+            distinct_range = (min(chao1, most), most)
+
+        return cls(hits, len(counts), distinct_range, len(id_data), len(sample))
+
+    def is_likely(self, threshold: float) -> bool:
+        """Whether the threshold lies within reach of the confidence interval."""
+        return self.high >= threshold
@@ -0,0 +1,73 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from ..utils.db_connection import DatabaseConnection
+from .columnprofilecache import DEFAULT_MEMORY_BUDGET, ColumnProfileCache
+from .tablenameindex import TableNameIndex
+from .relationdiscovery import DataMatch, PairKey, discover_tables
+
+def _discover_table_group(db_path: str, table_names: List[str], source_tables: List[str], mode: str,
+                          known: Dict[PairKey, float],
+                          memory_budget: int = DEFAULT_MEMORY_BUDGET) -> Tuple[Dict[str, List[DataMatch]], Dict[PairKey, Tuple[float, float]]]:
+    """Worker entry point: discover the relations of a group of source tables."""
+    db = DatabaseConnection(db_path, read_only=True)
+    try:
+        # Each worker keeps its own profile cache for the tables it reads
+        profiles = ColumnProfileCache(db.cursor, memory_budget)
+        name_index = TableNameIndex(table_names)
+
+        results = {table_name: [] for table_name in source_tables}
+        evaluated = {}
+        for match in discover_tables(profiles, name_index, source_tables, mode, known, evaluated):
+            results[match[0]].append(match)
+        return results, evaluated
+    finally:
+        db.close()
+
+def discover_relations_parallel(db_path: str, table_names: List[str], source_tables: List[str],
+                                mode: str = 'exact', workers: Optional[int] = None,
+                                known: Optional[Dict[PairKey, float]] = None,
+                                evaluated: Optional[Dict[PairKey, Tuple[float, float]]] = None,
+                                memory_budget: int = DEFAULT_MEMORY_BUDGET) -> List[DataMatch]:
+    """
+    Discover relations across a pool of worker processes, split by source table.
+
+    Each worker opens its own read-only connection and profile cache; memory_budget
+    is split evenly between the caches, so peak memory does not grow with workers.
+    Results are returned in the order of source_tables, whatever the number of workers.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(source_tables)))
+    known = known or {}
+
+    # Interleave tables so every worker gets a similar mix of table sizes
+    groups = [source_tables[i::workers] for i in range(workers)]
+    worker_budget = memory_budget // workers
+    logging.info(f"Discovering relations for {len(source_tables)} tables with {workers} workers")
+
+    results = {}
+    group_evaluated = {}
+    if workers == 1:
+        results, group_evaluated = _discover_table_group(db_path, table_names, source_tables, mode, known,
+                                                         memory_budget)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_discover_table_group, db_path, table_names, group, mode, known,
+                                       worker_budget)
+                       for group in groups]
+            for future in futures:
+                group_results, pairs = future.result()
+                results.update(group_results)
+                group_evaluated.update(pairs)
+
+    data_matching_info = []
+    for table_name in source_tables:
+        data_matching_info.extend(results.get(table_name, []))
+
+    if evaluated is not None:
+        # Keep pairs in source-table order, as the serial path does
+        for table_name in source_tables:
+            evaluated.update((key, value) for key, value in group_evaluated.items() if key[0] == table_name)
+    return data_matching_info
@@ -1,8 +1,84 @@
 from ..utils.db_connection import DatabaseConnection
-from ..utils.db_utils import delete_empty_tables, delete_empty_columns
+from typing import Dict, List, Optional
 import logging
 import sqlite3
 
+# Prefix of the partial indexes holding the rows that have no ProjectInformation_id yet
+UNSTAMPED_INDEX_PREFIX = "idx_unstamped_"
+
+def add_project_column(cursor, table_name: str, project_id=None) -> None:
+    """
+    Add ProjectInformation_id to a table and stamp its existing rows with project_id.
+
+    The column gets no default: rows inserted later stay NULL, so the backfill
+    of the next project still finds them instead of inheriting this project's id.
+    """
+    cursor.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "ProjectInformation_id" INTEGER')
+    if project_id is not None:
+        cursor.execute(f'UPDATE "{table_name}" SET "ProjectInformation_id" = ?', (int(project_id),))
+
+def resolve_project_id(cursor) -> Optional[int]:
+    """Return the id of the most recent project, the one new rows are stamped with."""
+    cursor.execute('SELECT MAX("ProjectInformation_id") FROM "ProjectInformation"')
+    return cursor.fetchone()[0]
+
+def backfill_project_id(cursor, project_id: int, table_names: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Set ProjectInformation_id to project_id in every row that has none, without committing.
+
+    The rows are found through a partial index over the NULL values, which stays
+    empty once a table is stamped, so later runs find new unstamped rows without
+    a scan. Returns the number of rows updated per table.
+    """
+
+    if table_names is None:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        table_names = [row[0] for row in cursor.fetchall()
+                       if row[0] != 'ProjectInformation' and not row[0].startswith('sqlite_')]
+
+    updated = {}
+    for table_name in table_names:
+        cursor.execute(f'PRAGMA table_info("{table_name}")')
+        if not any(col[1] == 'ProjectInformation_id' for col in cursor.fetchall()):
+            continue
+
+        try:
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS "{UNSTAMPED_INDEX_PREFIX}{table_name}"
+                ON "{table_name}" ("ProjectInformation_id")
+                WHERE "ProjectInformation_id" IS NULL
+            ''')
+            cursor.execute(f'''
+                UPDATE "{table_name}"
+                SET "ProjectInformation_id" = ?
+                WHERE "ProjectInformation_id" IS NULL
+            ''', (project_id,))
+        except sqlite3.OperationalError as e:
+            logging.warning(f"Could not update ProjectInformation_id in {table_name}: {e}")
+            continue
+
+        if cursor.rowcount > 0:
+            updated[table_name] = cursor.rowcount
+            logging.info(f"Set ProjectInformation_id of {cursor.rowcount} rows in {table_name}")
+
+    return updated
+
+def backfill_project_information_id(db_path: str, project_id: Optional[int] = None) -> Dict[str, int]:
+    """Stamp every unstamped row with project_id, or the most recent project, in one transaction."""
+    db = DatabaseConnection(db_path)
+    try:
+        db.cursor.execute("BEGIN")
+        if project_id is None:
+            project_id = resolve_project_id(db.cursor)
+        updated = backfill_project_id(db.cursor, project_id) if project_id is not None else {}
+        db.commit()
+        return updated
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
 def ensure_project_information_id(db_path):
     """
     Ensures that the ProjectInformation_id column exists in all tables and updates its values.
@@ -13,19 +89,8 @@ def ensure_project_information_id(db_path):
     try:
         logging.debug(f"Ensuring ProjectInformation_id in database: {db_path}")
 
-        # Delete empty tables
-        logging.debug("Deleting empty tables")
-        delete_empty_tables(db_path)
-
-        # Delete empty columns
-        logging.debug("Deleting empty columns")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        for table in tables:
-            table_name = table[0]
-            if table_name == 'sqlite_sequence':
-                continue
-            delete_empty_columns(db_path, table_name)
+        # Every table is stamped in one transaction
+        cursor.execute("BEGIN")
 
         # Check if ProjectInformation table exists
         logging.debug("Checking if ProjectInformation table exists")
@@ -54,10 +119,14 @@ def ensure_project_information_id(db_path):
         if not any(col[1].lower() == 'projectinformation_id' and col[5] == 1 for col in columns):
             raise Exception("ProjectInformation_id is not set as the primary key in ProjectInformation table.")
 
+        # The most recent project is resolved once and stamped into every table
+        project_id = resolve_project_id(cursor)
+
         # Add ProjectInformation_id column to all tables
         logging.debug("Adding ProjectInformation_id column to all tables")
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
         tables = cursor.fetchall()
+        existing = []
         for table in tables:
             table_name = table[0]
             if table_name in ['ProjectInformation', 'sqlite_sequence']:
@@ -68,30 +137,21 @@ def ensure_project_information_id(db_path):
             columns = cursor.fetchall()
             column_names = [col[1] for col in columns]
 
-            if 'ProjectInformation_id' not in column_names:
-                try:
-                    logging.info(f"Adding ProjectInformation_id to table {table_name}")
-                    cursor.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "ProjectInformation_id" INTEGER')
-                except sqlite3.OperationalError as e:
-                    logging.warning(f"Could not add ProjectInformation_id to {table_name}: {e}")
-            else:
+            if 'ProjectInformation_id' in column_names:
                 logging.debug(f"ProjectInformation_id already exists in table {table_name}")
+                existing.append(table_name)
+                continue
 
-            # Update ProjectInformation_id column with the most recent ProjectInformation_id
             try:
-                logging.info(f"Updating ProjectInformation_id in table {table_name}")
-                cursor.execute(f'''
-                    UPDATE "{table_name}"
-                    SET "ProjectInformation_id" = (
-                        SELECT "ProjectInformation_id"
-                        FROM "ProjectInformation"
-                        ORDER BY "ProjectInformation_id" DESC
-                        LIMIT 1
-                    )
-                    WHERE "ProjectInformation_id" IS NULL
-                ''')
+                # A new column is stamped with the project right away
+                logging.info(f"Adding ProjectInformation_id to table {table_name}")
+                add_project_column(cursor, table_name, project_id)
             except sqlite3.OperationalError as e:
-                logging.warning(f"Could not update ProjectInformation_id to {table_name}: {e}")
+                logging.warning(f"Could not add ProjectInformation_id to {table_name}: {e}")
+
+        # Existing columns only have their unstamped rows filled in
+        if project_id is not None:
+            backfill_project_id(cursor, project_id, existing)
 
         db.commit()
         logging.info("Successfully ensured ProjectInformation_id in all tables.")
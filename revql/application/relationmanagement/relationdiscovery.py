@@ -0,0 +1,257 @@
+import sqlite3
+import logging
+from typing import Dict, List, Optional, Tuple
+from .matchratiocalc import get_overlap_percentage, batch_prefix_similarity
+from .columnprofilecache import ColumnProfileCache
+from .tablenameindex import TableNameIndex
+from .sqloverlap import SqlKeyTableCache
+from .keysets import contains_key
+from .overlapsampling import SampledOverlap
+
+# Minimum name similarity between a column and a table name
+NAME_MATCH_THRESHOLD = 0.8
+
+# Minimum data overlap percentage for a relation to be accepted
+OVERLAP_THRESHOLD = 95.0
+
+# Margin below the overlap threshold within which sketch estimates get an exact check
+SKETCH_MARGIN = 10.0
+
+# How data overlap is computed:
+#   exact       - distinct values compared in Python sets
+#   approximate - sketches rank candidates, only those near the threshold are checked exactly
+#   sql         - distinct values compared inside SQLite through indexed temporary tables
+#   probe       - source values streamed against the target's key set, stopping as soon
+#                 as the threshold becomes unreachable
+#   sample      - a random sample of source rows tested against the target's key set;
+#                 matches carry a confidence interval and are estimates only
+DISCOVERY_MODES = ('exact', 'approximate', 'sql', 'probe', 'sample')
+
+# (table, column, match_table, id_column, match_ratio)
+Candidate = Tuple[str, str, str, str, float]
+
+# (table, column, match_table, id_column)
+PairKey = Tuple[str, str, str, str]
+
+# (table, column, match_table, match_ratio, overlap), as consumed by RelationRatioViewer.
+# Sampled matches carry the (low, high) confidence interval of the overlap as a sixth item.
+DataMatch = Tuple[str, str, str, float, float]
+
+def find_table_candidates(profiles: ColumnProfileCache, name_index: TableNameIndex, table_name: str) -> List[Candidate]:
+    """Find the columns of a table whose names match another table with an ID column."""
+    candidates = []
+    for column_name in profiles.get_populated_columns(table_name):
+        # Skip comparing table to itself
+        name_candidates = [t_name for t_name in name_index.candidates(column_name, NAME_MATCH_THRESHOLD)
+                           if t_name != table_name]
+
+        # Use prefix similarity to match column_name with the candidate table names
+        for t_name, match_ratio in zip(name_candidates, batch_prefix_similarity(column_name, name_candidates)):
+            if match_ratio < NAME_MATCH_THRESHOLD:
+                continue
+
+            try:
+                # Get ID columns from matching table
+                id_columns = profiles.get_id_columns(t_name)
+                if id_columns:
+                    # Data overlap is checked against the first ID column
+                    candidates.append((table_name, column_name, t_name, id_columns[0], match_ratio))
+            except sqlite3.Error as e:
+                logging.error(f"Error checking {table_name}.{column_name}: {e}")
+
+    return candidates
+
+def check_candidates(profiles: ColumnProfileCache, candidates: List[Candidate], mode: str = 'exact',
+                     key_tables: Optional[SqlKeyTableCache] = None,
+                     known: Optional[Dict[PairKey, float]] = None,
+                     evaluated: Optional[Dict[PairKey, Tuple[float, float]]] = None) -> List[DataMatch]:
+    """
+    Check the data overlap of candidate relations and return the accepted ones.
+
+    Pairs found in known reuse their stored overlap instead of being checked
+    again. When evaluated is given, it receives the match ratio and overlap of
+    every candidate, in candidate order.
+    """
+    known = known or {}
+    overlaps: Dict[PairKey, float] = {}
+    samples: Dict[PairKey, SampledOverlap] = {}
+
+    pending = [candidate for candidate in candidates if candidate[:4] not in known]
+    if mode == 'approximate':
+        ranked = rank_candidates_by_sketch(profiles, pending)
+        ranked_keys = {candidate[:4] for candidate in ranked}
+
+        # Pruned candidates are recorded as non-matches
+        for candidate in pending:
+            if candidate[:4] not in ranked_keys:
+                overlaps[candidate[:4]] = 0.0
+        pending = ranked
+    elif mode == 'sql' and key_tables is None:
+        key_tables = SqlKeyTableCache(profiles.cursor)
+
+    for table_name, column_name, t_name, id_column, match_ratio in pending:
+        try:
+            if mode == 'sql':
+                if not key_tables.distinct_count(table_name, column_name):  # Skip if no data
+                    overlaps[(table_name, column_name, t_name, id_column)] = 0.0
+                    continue
+
+                overlap_percentage = key_tables.overlap_percentage(table_name, column_name, t_name, id_column)
+            elif mode == 'probe':
+                overlap_percentage = probe_overlap_percentage(profiles, table_name, column_name, t_name, id_column)
+                if overlap_percentage is None:
+                    overlaps[(table_name, column_name, t_name, id_column)] = 0.0
+                    logging.info(f"No match: {table_name}.{column_name} -> {t_name}.{id_column} (stopped early)")
+                    continue
+            elif mode == 'sample':
+                sample = profiles.get_sample(table_name, column_name)
+                if not sample:  # Skip if no data
+                    overlaps[(table_name, column_name, t_name, id_column)] = 0.0
+                    continue
+
+                estimate = SampledOverlap.from_sample(sample, profiles.get_distinct_values(t_name, id_column))
+                samples[(table_name, column_name, t_name, id_column)] = estimate
+                overlaps[(table_name, column_name, t_name, id_column)] = estimate.overlap
+                logging.info(f"Sampled: {table_name}.{column_name} -> {t_name}.{id_column} "
+                             f"(Overlap: {estimate.overlap:.2f}%, 95% CI {estimate.low:.2f}-{estimate.high:.2f}%, "
+                             f"{estimate.sample_size} rows)")
+                continue
+            else:
+                # Check if data in the matched column exists in the matching table
+                column_data = profiles.get_distinct_values(table_name, column_name)
+
+                if not column_data:  # Skip if no data
+                    overlaps[(table_name, column_name, t_name, id_column)] = 0.0
+                    continue
+
+                id_data = profiles.get_distinct_values(t_name, id_column)
+                overlap_percentage = get_overlap_percentage(column_data, id_data)
+
+            overlaps[(table_name, column_name, t_name, id_column)] = overlap_percentage
+            if overlap_percentage >= OVERLAP_THRESHOLD:
+                logging.info(f"Match found: {table_name}.{column_name} -> {t_name}.{id_column} (Overlap: {overlap_percentage:.2f}%)")
+            else:
+                logging.info(f"No match: {table_name}.{column_name} -> {t_name}.{id_column} (Overlap: {overlap_percentage:.2f}%)")
+
+        except sqlite3.Error as e:
+            logging.error(f"Error checking {table_name}.{column_name}: {e}")
+            continue
+
+    data_matching_info = []
+    for table_name, column_name, t_name, id_column, match_ratio in candidates:
+        key = (table_name, column_name, t_name, id_column)
+        overlap_percentage = known[key] if key in known else overlaps.get(key)
+        if overlap_percentage is None:
+            continue
+
+        if evaluated is not None:
+            evaluated[key] = (match_ratio, overlap_percentage)
+        if key in samples:
+            # Sampled pairs are kept while the threshold is within their confidence interval
+            estimate = samples[key]
+            if estimate.is_likely(OVERLAP_THRESHOLD):
+                data_matching_info.append((table_name, column_name, t_name, match_ratio, overlap_percentage,
+                                           (estimate.low, estimate.high)))
+        elif overlap_percentage >= OVERLAP_THRESHOLD:
+            data_matching_info.append((table_name, column_name, t_name, match_ratio, overlap_percentage))
+
+    return data_matching_info
+
+def probe_overlap_percentage(profiles: ColumnProfileCache, table_name: str, column_name: str, t_name: str,
+                             id_column: str, threshold: float = OVERLAP_THRESHOLD) -> Optional[float]:
+    """
+    Stream the source column against the target's key set with a miss budget.
+
+    Returns the exact overlap percentage, or None as soon as enough values have
+    missed that the threshold can no longer be reached.
+    """
+    id_data = profiles.get_distinct_values(t_name, id_column)
+    if not id_data:
+        return 0.0
+
+    source_count, values = profiles.stream_distinct_values(table_name, column_name)
+    smaller = min(source_count, len(id_data))
+    if not smaller:
+        return 0.0
+
+    hits = 0
+    misses = 0
+    for value in values:
+        if contains_key(id_data, value):
+            hits += 1
+        else:
+            misses += 1
+            # Even if every remaining value hits, the overlap stays below the threshold
+            if (source_count - misses) / smaller * 100 < threshold:
+                return None
+
+    return (hits / smaller) * 100
+
+def rank_candidates_by_sketch(profiles: ColumnProfileCache, candidates: List[Candidate],
+                              threshold: float = OVERLAP_THRESHOLD, margin: float = SKETCH_MARGIN) -> List[Candidate]:
+    """
+    Rank candidate relations by their sketch-estimated overlap.
+
+    Returns only the candidates close enough to the threshold to need an exact
+    check, highest estimate first.
+    """
+    ranked = []
+    for table_name, column_name, t_name, id_column, match_ratio in candidates:
+        try:
+            column_sketch = profiles.get_sketch(table_name, column_name)
+            if not column_sketch:  # Skip if no data
+                continue
+
+            id_sketch = profiles.get_sketch(t_name, id_column)
+            estimate = column_sketch.compare(id_sketch)
+        except sqlite3.Error as e:
+            logging.error(f"Error sketching {table_name}.{column_name}: {e}")
+            continue
+
+        if estimate.is_near(threshold, margin):
+            ranked.append((estimate.overlap, (table_name, column_name, t_name, id_column, match_ratio)))
+        else:
+            logging.info(f"Pruned: {table_name}.{column_name} -> {t_name}.{id_column} "
+                         f"(Estimated overlap: {estimate.overlap:.2f}%, "
+                         f"~{column_sketch.cardinality():.0f} vs ~{id_sketch.cardinality():.0f} distinct values)")
+
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return [candidate for _, candidate in ranked]
+
+def recheck_matches(profiles: ColumnProfileCache, matches: List[DataMatch]) -> List[DataMatch]:
+    """
+    Check the exact overlap of already discovered matches, e.g. to confirm sampled ones.
+
+    Returns every match with its recomputed overlap, including those that fall
+    below the threshold, in the order given.
+    """
+    candidates = []
+    for table_name, column_name, t_name, match_ratio, *_ in matches:
+        id_columns = profiles.get_id_columns(t_name)
+        if id_columns:
+            candidates.append((table_name, column_name, t_name, id_columns[0], match_ratio))
+
+    evaluated = {}
+    check_candidates(profiles, candidates, 'exact', evaluated=evaluated)
+    return [(key[0], key[1], key[2], match_ratio, overlap)
+            for key, (match_ratio, overlap) in evaluated.items()]
+
+def discover_tables(profiles: ColumnProfileCache, name_index: TableNameIndex, table_names: List[str],
+                    mode: str = 'exact', known: Optional[Dict[PairKey, float]] = None,
+                    evaluated: Optional[Dict[PairKey, Tuple[float, float]]] = None) -> List[DataMatch]:
+    """Discover the relations of each source table, in the order the tables are given."""
+    if mode not in DISCOVERY_MODES:
+        raise ValueError(f"Unknown discovery mode '{mode}', expected one of {', '.join(DISCOVERY_MODES)}")
+
+    # Key tables are shared by every source table of the run
+    key_tables = SqlKeyTableCache(profiles.cursor) if mode == 'sql' else None
+
+    try:
+        data_matching_info = []
+        for table_name in table_names:
+            candidates = find_table_candidates(profiles, name_index, table_name)
+            data_matching_info.extend(check_candidates(profiles, candidates, mode, key_tables, known, evaluated))
+        return data_matching_info
+    finally:
+        if key_tables is not None:
+            key_tables.drop()
@@ -0,0 +1,63 @@
+import logging
+import sqlite3
+from typing import Dict, Tuple
+from .keysets import key_sql
+
+class SqlKeyTableCache:
+    """
+    Computes column overlap inside SQLite instead of in Python sets.
+
+    Each column's distinct values are loaded once into an indexed temporary
+    table, and the overlap of two columns is a single aggregate join between
+    their key tables. Values are compared by their key text, as in the Python
+    key sets, and never cross into Python, so columns larger than RAM can be compared.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+        self._key_tables: Dict[Tuple[str, str], Tuple[str, int]] = {}
+
+    def key_table(self, table_name: str, column_name: str) -> Tuple[str, int]:
+        """Return the temporary key table of a column and its distinct value count."""
+        key = (table_name, column_name)
+        if key not in self._key_tables:
+            temp_name = f"_revql_keys_{len(self._key_tables)}"
+            self.cursor.execute(f'DROP TABLE IF EXISTS temp."{temp_name}"')
+            self.cursor.execute(f'CREATE TEMP TABLE "{temp_name}" ("value" TEXT PRIMARY KEY) WITHOUT ROWID')
+            self.cursor.execute(f'''
+                INSERT OR IGNORE INTO temp."{temp_name}" ("value")
+                SELECT {key_sql(f'"{column_name}"')}
+                FROM main."{table_name}"
+                WHERE "{column_name}" IS NOT NULL
+            ''')
+            self.cursor.execute(f'SELECT COUNT(*) FROM temp."{temp_name}"')
+            self._key_tables[key] = (temp_name, self.cursor.fetchone()[0])
+        return self._key_tables[key]
+
+    def distinct_count(self, table_name: str, column_name: str) -> int:
+        """Return the number of distinct non-null values of a column."""
+        return self.key_table(table_name, column_name)[1]
+
+    def overlap_percentage(self, table_name: str, column_name: str, t_name: str, id_column: str) -> float:
+        """Calculate the overlap percentage between two columns, like get_overlap_percentage."""
+        source_table, source_count = self.key_table(table_name, column_name)
+        target_table, target_count = self.key_table(t_name, id_column)
+        if not source_count or not target_count:
+            return 0.0
+
+        self.cursor.execute(f'''
+            SELECT COUNT(*)
+            FROM temp."{source_table}" s
+            JOIN temp."{target_table}" t ON t."value" = s."value"
+        ''')
+        intersection = self.cursor.fetchone()[0]
+        return (intersection / min(source_count, target_count)) * 100
+
+    def drop(self) -> None:
+        """Drop every temporary key table."""
+        for temp_name, _ in self._key_tables.values():
+            try:
+                self.cursor.execute(f'DROP TABLE IF EXISTS temp."{temp_name}"')
+            except sqlite3.Error as e:
+                logging.warning(f"Could not drop temporary table {temp_name}: {e}")
+        self._key_tables.clear()
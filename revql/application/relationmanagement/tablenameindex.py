@@ -0,0 +1,83 @@
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+class TableNameIndex:
+    """
+    Candidate index over lower-cased table names.
+
+    Used to prune name matching before exact scoring: instead of comparing every
+    column name with every table name, only tables that share an n-gram with the
+    column name and have a compatible length are returned.
+    """
+
+    # Largest n-gram size kept in the index
+    GRAM_SIZE = 3
+
+    def __init__(self, table_names: Iterable[str]):
+        self.table_names = list(table_names)
+        self._lengths: List[int] = []
+        self._exact: Dict[str, List[int]] = defaultdict(list)
+        self._grams: Dict[int, Dict[str, Set[int]]] = {q: defaultdict(set) for q in range(1, self.GRAM_SIZE + 1)}
+
+        for position, name in enumerate(self.table_names):
+            lowered = name.lower()
+            self._lengths.append(len(lowered))
+            self._exact[lowered].append(position)
+            for q in range(1, self.GRAM_SIZE + 1):
+                for gram in self._ngrams(lowered, q):
+                    self._grams[q][gram].add(position)
+
+    def exact(self, name: str) -> List[str]:
+        """Return the table names equal to name, ignoring case."""
+        return [self.table_names[position] for position in self._exact.get(name.lower(), [])]
+
+    def candidates(self, name: str, threshold: float = 0.8) -> List[str]:
+        """
+        Return the table names whose prefix similarity with name could reach threshold.
+
+        The result is a superset of the real matches, in the order the tables were
+        indexed, so callers must still score every candidate exactly.
+        """
+        query = name.lower()
+        n = len(query)
+
+        # Any similarity score reaching the threshold needs a common substring of
+        # at least (2 * threshold - 1) * (n + m) / 2 characters
+        factor = 2.0 * threshold - 1.0
+        if factor <= 0:
+            return list(self.table_names)
+
+        hits: Dict[int, Set[int]] = {}
+        matches = []
+        for position in self._candidate_positions(query):
+            m = self._lengths[position]
+            required = max(1, math.ceil(factor * (n + m) / 2.0 - 1e-9))
+            if min(n, m) < required:
+                continue
+
+            # A common substring of the required length shares at least one q-gram
+            q = min(self.GRAM_SIZE, required)
+            if q not in hits:
+                hits[q] = self._gram_hits(query, q)
+            if position in hits[q]:
+                matches.append(position)
+
+        return [self.table_names[position] for position in sorted(matches)]
+
+    def _candidate_positions(self, query: str) -> Set[int]:
+        """Return every table sharing at least one character with the query."""
+        return self._gram_hits(query, 1)
+
+    def _gram_hits(self, query: str, q: int) -> Set[int]:
+        """Return every table sharing at least one q-gram with the query."""
+        positions: Set[int] = set()
+        postings = self._grams[q]
+        for gram in self._ngrams(query, q):
+            positions.update(postings.get(gram, ()))
+        return positions
+
+    @staticmethod
+    def _ngrams(text: str, q: int) -> Set[str]:
+        """Return the distinct q-grams of text."""
+        return {text[i:i + q] for i in range(len(text) - q + 1)}
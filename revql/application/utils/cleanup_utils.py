@@ -1,6 +1,9 @@
+import re
 import sqlite3
 import logging
+from typing import Dict, List
 from revql.application.utils.db_connection import DatabaseConnection
+from revql.application.utils.vacuum_utils import reclaim_space
 
 def delete_empty_tables(db_path):
     """
@@ -44,67 +47,387 @@ def delete_empty_tables(db_path):
     finally:
         conn.close()
 
+# Columns counted per aggregate query, well below SQLite's result column limit
+COUNT_CHUNK_SIZE = 500
+
+def count_non_null_values(cursor, table_name: str, column_names, chunk_size: int = COUNT_CHUNK_SIZE):
+    """
+    Count the non-null values of every given column in a single table scan.
+
+    Columns are counted together with COUNT(col1), COUNT(col2), ... in chunks of
+    chunk_size, so a table of up to chunk_size columns costs one scan.
+    """
+    counts = {}
+    column_names = list(column_names)
+    for start in range(0, len(column_names), chunk_size):
+        chunk = column_names[start:start + chunk_size]
+        counts_sql = ", ".join(f'COUNT("{name}")' for name in chunk)
+        cursor.execute(f'SELECT {counts_sql} FROM "{table_name}"')
+        counts.update(zip(chunk, cursor.fetchone()))
+    return counts
+
+def _mentions_column(sql: str, column_name: str) -> bool:
+    """Whether SQL text refers to a column, bare or quoted; errs towards True on look-alike text."""
+    pattern = rf'(?<![\w$])["`\[]?{re.escape(column_name)}["`\]]?(?![\w$])'
+    return re.search(pattern, sql, re.IGNORECASE) is not None
+
+def _index_body(index_sql: str) -> str:
+    """The column list and WHERE clause of a CREATE INDEX statement, without the index and table names."""
+    return index_sql[index_sql.find('('):]
+
+def tables_used_by_dependents(cursor, table_name: str) -> List[str]:
+    """Views and triggers of other tables whose SQL refers to the table."""
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type IN ('view', 'trigger') "
+                   "AND tbl_name != ? AND sql IS NOT NULL", (table_name,))
+    return [name for name, sql in cursor.fetchall() if _mentions_column(sql, table_name)]
+
+def columns_used_by_dependents(cursor, table_name: str, column_names) -> Dict[str, List[str]]:
+    """Views and triggers whose SQL refers to the table and to each of the columns, by column."""
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type IN ('view', 'trigger') AND sql IS NOT NULL")
+    dependents = [(name, sql) for name, sql in cursor.fetchall() if _mentions_column(sql, table_name)]
+    used = {}
+    for column_name in column_names:
+        names = [name for name, sql in dependents if _mentions_column(sql, column_name)]
+        if names:
+            used[column_name] = names
+    return used
+
+def can_drop_column_in_place(cursor, table_name: str, column_name: str) -> bool:
+    """
+    Whether ALTER TABLE ... DROP COLUMN can remove the column.
+
+    Requires SQLite 3.35+, and a column that is not part of the primary key,
+    a UNIQUE constraint, an index, a partial index's WHERE clause or a foreign
+    key. CHECK constraints are not inspected; drop_columns falls back when
+    SQLite refuses.
+    """
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        return False
+
+    cursor.execute(f'PRAGMA table_info("{table_name}")')
+    column = next((col for col in cursor.fetchall() if col[1] == column_name), None)
+    if column is None or column[5]:
+        return False
+
+    # UNIQUE constraints are backed by automatic indexes, so this covers them too
+    cursor.execute(f'PRAGMA index_list("{table_name}")')
+    for index in cursor.fetchall():
+        index_name, partial = index[1], index[4]
+        cursor.execute(f'PRAGMA index_info("{index_name}")')
+        if column_name in [info[2] for info in cursor.fetchall()]:
+            return False
+        if partial:
+            # Only a WHERE clause that uses the column gets in the way
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type='index' AND name=?", (index_name,))
+            row = cursor.fetchone()
+            if row is None or row[0] is None or _mentions_column(_index_body(row[0]), column_name):
+                return False
+
+    cursor.execute(f'PRAGMA foreign_key_list("{table_name}")')
+    return all(fk[3] != column_name for fk in cursor.fetchall())
+
+def drop_columns(cursor, table_name: str, column_names) -> str:
+    """
+    Remove columns from a table with at most one rewrite of its rows, without committing.
+
+    A single column is dropped in place with ALTER TABLE ... DROP COLUMN when
+    SQLite allows it. Several columns, or one that cannot be dropped in place,
+    are removed by one rebuild that keeps the remaining columns' types,
+    constraints, foreign keys, indexes and triggers. Columns that a view or
+    trigger refers to are not removed: a ValueError is raised before anything
+    changes. Returns 'none', 'in_place' or 'rebuild'.
+    """
+    cursor.execute(f'PRAGMA table_info("{table_name}")')
+    columns = cursor.fetchall()
+    existing = {col[1] for col in columns}
+    drop = [name for name in dict.fromkeys(column_names) if name in existing]
+    if not drop:
+        return 'none'
+    if len(drop) == len(columns):
+        raise ValueError(f"Cannot remove every column of table {table_name}")
+    used = columns_used_by_dependents(cursor, table_name, drop)
+    if used:
+        # The views and triggers would break, so nothing is changed
+        raise ValueError(f"Cannot remove columns of {table_name} used by views or triggers: "
+                         + ", ".join(f"{column} ({', '.join(names)})" for column, names in used.items()))
+
+    # Each DROP COLUMN rewrites the table, so only a single column is dropped in place
+    if len(drop) == 1 and can_drop_column_in_place(cursor, table_name, drop[0]):
+        try:
+            cursor.execute(f'ALTER TABLE "{table_name}" DROP COLUMN "{drop[0]}"')
+            return 'in_place'
+        except sqlite3.OperationalError as e:
+            logging.info(f"Cannot drop {table_name}.{drop[0]} in place, rebuilding the table: {e}")
+
+    _rebuild_without_columns(cursor, table_name, columns, set(drop))
+    return 'rebuild'
+
+def _rebuild_without_columns(cursor, table_name: str, columns, drop) -> None:
+    """Rebuild a table without the given columns, in a single copy of its rows."""
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    row = cursor.fetchone()
+    autoincrement = row is not None and 'AUTOINCREMENT' in (row[0] or '').upper()
+
+    keep = [col for col in columns if col[1] not in drop]
+    keep_names = {col[1] for col in keep}
+    pk_columns = [col[1] for col in sorted((col for col in columns if col[5]), key=lambda col: col[5])]
+    single_pk = len(pk_columns) == 1 and pk_columns[0] in keep_names
+
+    create_columns = []
+    for _, column_name, column_type, not_null, default, is_pk in keep:
+        definition = f'"{column_name}" {column_type}'
+        if is_pk and single_pk:
+            definition += ' PRIMARY KEY'
+            if autoincrement and column_type.upper() == 'INTEGER':
+                definition += ' AUTOINCREMENT'
+        if not_null:
+            definition += ' NOT NULL'
+        if default is not None:
+            definition += f' DEFAULT {default}'
+        create_columns.append(definition)
+
+    if len(pk_columns) > 1 and all(name in keep_names for name in pk_columns):
+        pk_sql = ", ".join(f'"{name}"' for name in pk_columns)
+        create_columns.append(f'PRIMARY KEY ({pk_sql})')
+
+    # UNIQUE constraints only show up as automatic indexes
+    cursor.execute(f'PRAGMA index_list("{table_name}")')
+    for index in cursor.fetchall():
+        if index[3] != 'u':
+            continue
+        cursor.execute(f'PRAGMA index_info("{index[1]}")')
+        unique_columns = [info[2] for info in cursor.fetchall()]
+        if all(name in keep_names for name in unique_columns):
+            unique_sql = ", ".join(f'"{name}"' for name in unique_columns)
+            create_columns.append(f'UNIQUE ({unique_sql})')
+
+    # Foreign keys whose columns all survive are carried over
+    cursor.execute(f'PRAGMA foreign_key_list("{table_name}")')
+    foreign_keys = {}
+    for fk_id, _, ref_table, from_col, to_col, on_update, on_delete, _ in cursor.fetchall():
+        foreign_keys.setdefault(fk_id, (ref_table, [], [], on_update, on_delete))
+        foreign_keys[fk_id][1].append(from_col)
+        foreign_keys[fk_id][2].append(to_col)
+    for ref_table, from_cols, to_cols, on_update, on_delete in foreign_keys.values():
+        if any(col not in keep_names for col in from_cols):
+            continue
+        from_sql = ", ".join(f'"{col}"' for col in from_cols)
+        to_sql = ", ".join(f'"{col}"' for col in to_cols if col is not None)
+        references = f'"{ref_table}" ({to_sql})' if to_sql else f'"{ref_table}"'
+        create_columns.append(f'FOREIGN KEY ({from_sql}) REFERENCES {references} '
+                              f'ON UPDATE {on_update} ON DELETE {on_delete}')
+
+    # Explicitly created indexes are recreated when all their columns survive and,
+    # for partial and expression indexes, their SQL mentions no removed column
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+                   (table_name,))
+    indexes = []
+    for index_name, index_sql in cursor.fetchall():
+        cursor.execute(f'PRAGMA index_info("{index_name}")')
+        if not all(info[2] in keep_names for info in cursor.fetchall()):
+            continue
+        if any(_mentions_column(_index_body(index_sql), name) for name in drop):
+            logging.info(f"Dropping index {index_name}, it refers to a removed column of {table_name}")
+            continue
+        indexes.append(index_sql)
+
+    # Triggers on the table are dropped with it and recreated afterwards
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND tbl_name=? AND sql IS NOT NULL",
+                   (table_name,))
+    triggers = [row[0] for row in cursor.fetchall()]
+
+    temp_table = f"{table_name}_temp"
+    cursor.execute(f'DROP TABLE IF EXISTS "{temp_table}"')
+    cursor.execute(f'''
+        CREATE TABLE "{temp_table}" (
+            {", ".join(create_columns)}
+        )
+    ''')
+
+    keep_sql = ", ".join(f'"{col[1]}"' for col in keep)
+    cursor.execute(f'INSERT INTO "{temp_table}" ({keep_sql}) SELECT {keep_sql} FROM "{table_name}"')
+
+    # As in SQLite's own procedure for other schema changes, the rename is done in
+    # legacy mode, so views and triggers elsewhere that name the table are not
+    # checked while it is briefly missing, and simply find the new table afterwards
+    legacy = cursor.execute("PRAGMA legacy_alter_table").fetchone()[0]
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        cursor.execute(f'DROP TABLE "{table_name}"')
+        cursor.execute(f'ALTER TABLE "{temp_table}" RENAME TO "{table_name}"')
+    finally:
+        cursor.execute(f"PRAGMA legacy_alter_table = {'ON' if legacy else 'OFF'}")
+    for index_sql in indexes:
+        cursor.execute(index_sql)
+    for trigger_sql in triggers:
+        cursor.execute(trigger_sql)
+
+def delete_columns(db_path: str, table_name: str, column_names) -> str:
+    """Remove the given columns from a table and commit, see drop_columns."""
+    db = DatabaseConnection(db_path)
+    try:
+        # DDL does not open a transaction implicitly, so a failed rebuild could leave its temp table
+        db.cursor.execute("BEGIN")
+        method = drop_columns(db.cursor, table_name, column_names)
+        db.commit()
+        return method
+    except (sqlite3.Error, ValueError):
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+class CleanupPlan:
+    """Empty tables to drop and empty columns to remove, planned before anything is changed."""
+
+    def __init__(self):
+        self.tables = []
+        self.columns = {}
+
+    def is_empty(self) -> bool:
+        return not self.tables and not self.columns
+
+class CleanupReport:
+    """What a cleanup removed, and the pages it freed."""
+
+    def __init__(self, plan: CleanupPlan, pages_freed: int, page_size: int):
+        self.dropped_tables = plan.tables
+        self.removed_columns = plan.columns
+        self.pages_freed = pages_freed
+        self.page_size = page_size
+        self.vacuum = None
+
+    @property
+    def bytes_freed(self) -> int:
+        return self.pages_freed * self.page_size
+
+    def summary(self) -> str:
+        column_count = sum(len(columns) for columns in self.removed_columns.values())
+        summary = (f"Dropped {len(self.dropped_tables)} empty tables and {column_count} empty columns "
+                   f"from {len(self.removed_columns)} tables, freeing {self.pages_freed} pages "
+                   f"({self.bytes_freed / (1024 * 1024):.1f} MB)")
+        if self.vacuum is not None:
+            summary += f". {self.vacuum.summary()}"
+        return summary
+
+def plan_cleanup(cursor) -> CleanupPlan:
+    """
+    Find the empty tables and the empty columns of the remaining tables, without changing anything.
+
+    Tables are probed for a first row, and the columns of each table are counted
+    in one scan. Primary keys and ProjectInformation_id are always kept.
+    """
+    plan = CleanupPlan()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    table_names = [row[0] for row in cursor.fetchall() if not row[0].startswith('sqlite_')]
+
+    for table_name in table_names:
+        cursor.execute(f'SELECT 1 FROM "{table_name}" LIMIT 1')
+        if cursor.fetchone() is None:
+            # Empty tables that views or triggers refer to are kept, dropping them would break those
+            users = tables_used_by_dependents(cursor, table_name)
+            if users:
+                logging.warning(f"Keeping empty table {table_name}, used by {', '.join(users)}")
+            else:
+                plan.tables.append(table_name)
+            continue
+
+        cursor.execute(f'PRAGMA table_info("{table_name}")')
+        columns = cursor.fetchall()
+        candidates = [col[1] for col in columns if not col[5] and col[1] != "ProjectInformation_id"]
+        non_null_counts = count_non_null_values(cursor, table_name, candidates)
+        empty_columns = [name for name in candidates if non_null_counts[name] == 0]
+
+        if len(empty_columns) == len(columns):
+            logging.warning(f"Every column of {table_name} is empty, leaving it as is")
+            continue
+
+        # Columns that views or triggers refer to are kept, removing them would break those
+        for column_name, names in columns_used_by_dependents(cursor, table_name, empty_columns).items():
+            logging.warning(f"Keeping empty column {table_name}.{column_name}, used by {', '.join(names)}")
+            empty_columns.remove(column_name)
+        if empty_columns:
+            plan.columns[table_name] = empty_columns
+
+    return plan
+
+def apply_cleanup(connection: sqlite3.Connection, plan: CleanupPlan) -> CleanupReport:
+    """Apply a cleanup plan in a single transaction, rolling everything back on error."""
+    cursor = connection.cursor()
+    page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+    free_before = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+
+    # DDL does not open a transaction implicitly, so every change is wrapped explicitly
+    cursor.execute("BEGIN")
+    try:
+        for table_name in plan.tables:
+            cursor.execute(f'DROP TABLE "{table_name}"')
+        for table_name, column_names in plan.columns.items():
+            drop_columns(cursor, table_name, column_names)
+        connection.commit()
+    except (sqlite3.Error, ValueError):
+        connection.rollback()
+        raise
+
+    free_after = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+    return CleanupReport(plan, max(0, free_after - free_before), page_size)
+
+def run_cleanup(db_path: str, reclaim: bool = False) -> CleanupReport:
+    """
+    Plan and apply the removal of empty tables and columns on one connection, in one transaction.
+
+    With reclaim=True, the freed pages are then returned to the file system
+    through incremental vacuum (see vacuum_utils.reclaim_space).
+    """
+    db = DatabaseConnection(db_path)
+    try:
+        plan = plan_cleanup(db.cursor)
+        if plan.is_empty():
+            report = CleanupReport(plan, 0, 0)
+        else:
+            report = apply_cleanup(db.connection, plan)
+    finally:
+        db.close()
+
+    if reclaim:
+        report.vacuum = reclaim_space(db_path)
+    logging.info(report.summary())
+    return report
+
 def delete_empty_columns(db_path: str, table_name: str) -> None:
     """Delete empty columns from a table, skipping primary keys and handling locks."""
     db = None
     try:
         db = DatabaseConnection(db_path)
         cursor = db.cursor
+
+        # DDL does not open a transaction implicitly, so a multi-column drop is applied whole or not at all
+        cursor.execute("BEGIN")
         
         # Get table info including primary key information
         cursor.execute(f'PRAGMA table_info("{table_name}")')
         columns = cursor.fetchall()
         
-        # Create new table without empty columns
-        temp_table = f"{table_name}_temp"
-        keep_columns = []
-        
-        for col in columns:
-            column_name = col[1]
-            column_type = col[2]
-            is_pk = col[5]  # Check if column is primary key
-            
-            # Skip primary keys and ProjectInformation_id
-            if is_pk or column_name == "ProjectInformation_id":
-                keep_columns.append((column_name, column_type))
-                continue
-            
-            # Check if column is empty
-            cursor.execute(f'SELECT COUNT(*) FROM "{table_name}" WHERE "{column_name}" IS NOT NULL')
-            non_null_count = cursor.fetchone()[0]
-            
-            if non_null_count > 0:
-                keep_columns.append((column_name, column_type))
-        
-        # Create new table with remaining columns
-        create_columns = []
-        for col_name, col_type in keep_columns:
-            if col_name == f"{table_name}_id":
-                create_columns.append(f'"{col_name}" {col_type} PRIMARY KEY AUTOINCREMENT')
-            else:
-                create_columns.append(f'"{col_name}" {col_type}')
-        
-        cursor.execute(f'''
-            CREATE TABLE "{temp_table}" (
-                {", ".join(create_columns)}
-            )
-        ''')
-        
-        # Copy data from old table to new table
-        source_columns = [f'"{col[0]}"' for col in keep_columns]
-        cursor.execute(f'''
-            INSERT INTO "{temp_table}" ({", ".join(source_columns)})
-            SELECT {", ".join(source_columns)}
-            FROM "{table_name}"
-        ''')
-        
-        # Drop old table and rename new table
-        cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
-        cursor.execute(f'ALTER TABLE "{temp_table}" RENAME TO "{table_name}"')
+        # Count the values of every column in one scan instead of one scan per column
+        # Primary keys and ProjectInformation_id are always kept
+        candidates = [col[1] for col in columns if not col[5] and col[1] != "ProjectInformation_id"]
+        non_null_counts = count_non_null_values(cursor, table_name, candidates)
+        empty_columns = [name for name in candidates if non_null_counts[name] == 0]
+        for column_name, names in columns_used_by_dependents(cursor, table_name, empty_columns).items():
+            logging.warning(f"Keeping empty column {table_name}.{column_name}, used by {', '.join(names)}")
+            empty_columns.remove(column_name)
+
+        if len(empty_columns) == len(columns):
+            logging.warning(f"Every column of {table_name} is empty, leaving it as is")
+            return
+
+        method = drop_columns(cursor, table_name, empty_columns)
+        if method != 'none':
+            logging.info(f"Removed {len(empty_columns)} empty columns from {table_name} ({method})")
         
         db.commit()
         
-    except sqlite3.Error as e:
+    except (sqlite3.Error, ValueError) as e:
         if db:
             db.rollback()
         logging.warning(f"Error processing table {table_name}: {e}")
@@ -1,18 +1,24 @@
 import sqlite3
+from pathlib import Path
 from typing import Optional
 
 class DatabaseConnection:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, read_only: bool = False):
         """Initialize database connection"""
         self._connection: Optional[sqlite3.Connection] = None
         self._cursor: Optional[sqlite3.Cursor] = None
         self._db_path = db_path
+        self._read_only = read_only
         self._connect()
 
     def _connect(self):
         """Establish database connection"""
         try:
-            self._connection = sqlite3.connect(self._db_path)
+            if self._read_only:
+                uri = f"{Path(self._db_path).resolve().as_uri()}?mode=ro"
+                self._connection = sqlite3.connect(uri, uri=True)
+            else:
+                self._connection = sqlite3.connect(self._db_path)
             self._cursor = self._connection.cursor()
         except sqlite3.Error as e:
             raise RuntimeError(f"Failed to connect to database: {e}")
@@ -1,97 +1,135 @@
+import os
 import sqlite3
 import logging
 from revql.application.utils.db_connection import DatabaseConnection
 from revql.application.utils.cleanup_utils import delete_empty_tables, delete_empty_columns
 from typing import List, Tuple, Dict
-from ..relationmanagement.matchratiocalc import get_overlap_percentage
-from ..relationmanagement.matchratiocalc import prefix_similarity
+from ..relationmanagement.columnprofilecache import ColumnProfileCache
+from ..relationmanagement.tablenameindex import TableNameIndex
+from ..relationmanagement.relationdiscovery import OVERLAP_THRESHOLD, discover_tables, recheck_matches
+from ..relationmanagement.discoverystore import DiscoveryStore
+from ..relationmanagement.paralleldiscovery import discover_relations_parallel
 
-def find_matching_table_column_names(db_path):
-    db = DatabaseConnection(db_path)
+def find_matching_table_column_names(db_path, mode='probe', workers=1, incremental=True):
+    """
+    Find columns that reference other tables by name and by data overlap.
+
+    mode selects how overlap is computed: 'exact' compares Python sets,
+    'approximate' ranks candidates by a fixed-size sketch of each column and only
+    checks those near the overlap threshold exactly, 'sql' computes the
+    overlap inside SQLite without loading values into Python, and 'probe' streams
+    each column against the target's key set and stops once the threshold is out
+    of reach, which gives the same matches as 'exact' for a fraction of the work.
+    'sample' tests a random sample of rows per column for a quick first look;
+    its matches carry a 95% confidence interval and are never stored.
+    With workers other than 1, source tables are split across a process pool
+    (None uses every CPU); results keep the same order either way.
+    With incremental=True, results are kept in a sidecar store and only pairs
+    involving changed tables are evaluated again on later runs.
+    The database is opened read-only and never modified.
+    """
+    # Sampled estimates are not reused, nor used to skip exact checks later
+    store = _open_discovery_store(db_path) if incremental and mode != 'sample' else None
+    if store and store.is_unchanged(mode):
+        logging.info("Database unchanged since the last discovery run, reusing stored results")
+        data_matching_info = store.load_matches(mode, OVERLAP_THRESHOLD)
+        store.close()
+        return [], data_matching_info
+
+    # Discovery only reads: empty tables and all-null columns are skipped logically,
+    # cleanup is a separate step (DatabaseCleaner.cleanup_database)
+    db = DatabaseConnection(db_path, read_only=True)
     cursor = db._cursor
 
-    # Step 1: Delete empty tables
-    logging.info("Deleting empty tables...")
-    delete_empty_tables(db_path)
-
-    # Step 2: Delete empty columns from all tables
-    logging.info("Deleting empty columns...")
+    # Step 1: Get the list of tables that hold rows
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
     tables = cursor.fetchall()
-    for table in tables:
-        table_name = table[0]
-        if table_name != 'sqlite_sequence':  # Skip system tables
-            delete_empty_columns(db_path, table_name)
 
-    # Step 3: Get the list of all tables
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+    # Column values are read once per run and shared across all comparisons
+    profiles = ColumnProfileCache(cursor)
 
-    table_names = [table[0] for table in tables]
+    table_names = [table[0] for table in tables if profiles.has_rows(table[0])]
     matching_info = []
-    data_matching_info = []
-
-    # Step 4: Find matching table-column names
-    for table in tables:
-        table_name = table[0]
-        cursor.execute(f"PRAGMA table_info(\"{table_name}\");")
-        columns = cursor.fetchall()
-
-        for column in columns:
-            column_name = column[1]
-            
-            # Skip system tables
-            if table_name in ('sqlite_sequence', 'sqlite_master'):
-                continue
 
-            for t_name in table_names:
-                # Skip comparing table to itself
-                if table_name == t_name:
-                    continue
-
-                # Use prefix similarity to match column_name with table_name
-                match_ratio = prefix_similarity(column_name.lower(), t_name.lower())
-                if match_ratio < 0.8:  # Skip if similarity is below 80%
-                    continue
-
-                try:
-                    # Check if data in the matched column exists in the matching table
-                    cursor.execute(f"SELECT DISTINCT \"{column_name}\" FROM \"{table_name}\" WHERE \"{column_name}\" IS NOT NULL")
-                    column_data = set(str(item[0]) for item in cursor.fetchall() if item[0] is not None)
-
-                    if not column_data:  # Skip if no data
-                        continue
-
-                    # Get ID columns from matching table
-                    cursor.execute(f"PRAGMA table_info(\"{t_name}\");")
-                    columns_info = cursor.fetchall()
-                    id_columns = [col[1] for col in columns_info 
-                                if col[1].lower() == 'id' 
-                                or col[1].lower().endswith('id')]
-
-                    if id_columns:
-                        # Check for data overlap
-                        for id_column in id_columns:
-                            cursor.execute(f"SELECT DISTINCT \"{id_column}\" FROM \"{t_name}\" WHERE \"{id_column}\" IS NOT NULL")
-                            id_data = set(str(item[0]) for item in cursor.fetchall() if item[0] is not None)
-
-                            overlap_percentage = get_overlap_percentage(column_data, id_data)
-                            
-                            # Match if overlap is 95% or higher
-                            if overlap_percentage >= 95.0:
-                                data_matching_info.append((table_name, column_name, t_name, match_ratio, overlap_percentage))
-                                logging.info(f"Match found: {table_name}.{column_name} -> {t_name}.{id_column} (Overlap: {overlap_percentage:.2f}%)")
-                            else:
-                                logging.info(f"No match: {table_name}.{column_name} -> {t_name}.{id_column} (Overlap: {overlap_percentage:.2f}%)")
-                            break
-
-                except sqlite3.Error as e:
-                    logging.error(f"Error checking {table_name}.{column_name}: {e}")
-                    continue
-
-    db.commit()
+    # Skip system tables
+    source_tables = [name for name in table_names if name not in ('sqlite_sequence', 'sqlite_master')]
+
+    # Reuse the overlap of pairs whose tables have not changed since the last run
+    known = {}
+    evaluated = {}
+    if store:
+        fingerprints = store.compute_fingerprints(cursor, table_names)
+        known = store.load_results(mode, fingerprints)
+
+    # Step 2: Find matching table-column names and check their data overlap
+    if workers == 1:
+        # Only tables whose names could reach the similarity threshold are scored
+        name_index = TableNameIndex(table_names)
+
+        data_matching_info = discover_tables(profiles, name_index, source_tables, mode, known, evaluated)
+        logging.info(f"Column profile cache: {profiles.hits} hits, {profiles.misses} misses")
+    else:
+        data_matching_info = discover_relations_parallel(db_path, table_names, source_tables, mode, workers,
+                                                         known, evaluated)
+
+    db.close()
+
+    if store:
+        store.save(mode, fingerprints, evaluated)
+        store.close()
+
     return matching_info, data_matching_info
 
+def check_matches_exactly(db_path, data_matches):
+    """
+    Compute the exact overlap of the given matches, e.g. to promote sampled ones.
+
+    Returns each match with its exact overlap, whether or not it still reaches
+    the threshold.
+    """
+    db = DatabaseConnection(db_path, read_only=True)
+    try:
+        return recheck_matches(ColumnProfileCache(db.cursor), data_matches)
+    except sqlite3.Error as e:
+        logging.error(f"Error checking matches: {e}")
+        return []
+    finally:
+        db.close()
+
+def load_stored_matches(db_path, mode='probe'):
+    """
+    Return the stored results of the last discovery run without running discovery.
+
+    Returns (matching_info, is_current). matching_info is None when nothing is
+    stored for the current schema; is_current is False when the database was
+    written to after the results were stored.
+    """
+    # Only an existing store is read; none is created just to find it empty
+    if not os.path.exists(DiscoveryStore.sidecar_path(db_path)):
+        return None, False
+    store = _open_discovery_store(db_path, read_only=True)
+    if not store:
+        return None, False
+
+    try:
+        data_matching_info = store.load_latest(mode, OVERLAP_THRESHOLD)
+        if data_matching_info is None:
+            return None, False
+        return ([], data_matching_info), store.is_unchanged(mode)
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"Could not load stored discovery results: {e}")
+        return None, False
+    finally:
+        store.close()
+
+def _open_discovery_store(db_path, read_only=False):
+    """Open the sidecar discovery store, or return None if it cannot be used."""
+    try:
+        return DiscoveryStore(db_path, read_only)
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"Discovery store unavailable, running full discovery: {e}")
+        return None
+
 def get_table_data(db_path):
     """
     Retrieve table data including table name, row count, and column count.
@@ -1,34 +1,47 @@
 from .transactionmanager import TransactionManager
-from .tableoperations import TableOperations
+from .tableoperations import TableOperations, COPY_BATCH_SIZE, iter_rows, iter_batches
 from .projectinformationhandler import ProjectInformationHandler
 from .mergeddatabasecleaner import DatabaseCleaner
 from ..db_connection import DatabaseConnection
 import logging
 import sqlite3
 import os
-import time
-import shutil
+from typing import Optional
 from ..db_utils import find_matching_table_column_names
 from ...relationmanagement.idrefactor import rename_id_columns_and_create_relations
+from ...relationmanagement.projectmanagement import add_project_column
+from ..cleanup_utils import plan_cleanup, apply_cleanup
+from ..index_utils import create_relation_indexes
+from ..snapshot_utils import create_snapshot, prune_snapshots, DEFAULT_KEEP_SNAPSHOTS
 
 class DatabaseMerger:
-    def __init__(self, source_db_path: str, target_db_path: str):
+    def __init__(self, source_db_path: str, target_db_path: str, batch_size: int = COPY_BATCH_SIZE,
+                 snapshot_dir: Optional[str] = None, keep_snapshots: int = DEFAULT_KEEP_SNAPSHOTS):
         self.source_db_path = source_db_path
         self.target_db_path = target_db_path
+        # Rows per batch when tables are copied row by row, bounding memory use
+        self.batch_size = batch_size
+        # Optional point-in-time snapshots of the target, taken before each merge
+        self.snapshot_dir = snapshot_dir
+        self.keep_snapshots = keep_snapshots
         self.transaction_manager = TransactionManager()
         self.table_ops = TableOperations()
         self.project_info = ProjectInformationHandler()
         self.cleaner = DatabaseCleaner()
+        self._source_attached = False
 
     def merge_databases(self) -> bool:
         """
         Merge databases with guaranteed preservation of ProjectInformation_id values
         and proper relation creation.
+
+        The target is changed in a single transaction, so a failed merge is simply
+        rolled back and no backup copy is needed. With a snapshot_dir, a snapshot
+        of the target is taken first and older ones are pruned to keep_snapshots.
         """
-        # Create backup of target before proceeding
-        backup_path = f"{self.target_db_path}.backup_{int(time.time())}"
-        shutil.copy2(self.target_db_path, backup_path)
-        logging.info(f"Created backup of target database at {backup_path}")
+        if self.snapshot_dir:
+            create_snapshot(self.target_db_path, self.snapshot_dir)
+            prune_snapshots(self.target_db_path, self.snapshot_dir, self.keep_snapshots)
         
         # Phase 1: Prepare source database
         if not self._prepare_source_database():
@@ -37,8 +50,7 @@ class DatabaseMerger:
             
         # Phase 2: Execute merge with a direct approach
         if not self._execute_direct_merge():
-            logging.error("Direct merge failed. Restoring from backup.")
-            shutil.copy2(backup_path, self.target_db_path)
+            logging.error("Direct merge failed. The target database was rolled back unchanged.")
             return False
             
         logging.info("Database merge completed successfully.")
@@ -155,38 +167,36 @@ class DatabaseMerger:
                 result = cursor.fetchone()
                 existing_pi_id = result[0] if result and result[0] is not None else 1
 
-            # STEP 3: Add ProjectInformation_id to all tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT IN ('ProjectInformation', 'sqlite_sequence')")
-            tables = [row[0] for row in cursor.fetchall()]
+            # STEP 3: Identify potential relationships; discovery is read-only and skips empty tables and columns
+            conn.close()  # Close before the steps below open their own connections
+            try:
+                matching_info = find_matching_table_column_names(self.source_db_path)
+                data_matches = matching_info[1] if matching_info else []
+            except Exception as e:
+                logging.warning(f"Could not identify relationships: {e}")
+                data_matches = []
 
-            for table_name in tables:
-                # Check if ProjectInformation_id column exists
-                cursor.execute(f"PRAGMA table_info('{table_name}')")
-                columns = cursor.fetchall()
-                column_names = [col[1].lower() for col in columns]
+            # STEP 4: Drop empty tables; empty columns are removed within each table's rebuild below
+            db = DatabaseConnection(self.source_db_path)
+            try:
+                plan = plan_cleanup(db.cursor)
+                dropped_columns = plan.columns
+                plan.columns = {}
+                if not plan.is_empty():
+                    apply_cleanup(db.connection, plan)
+                    logging.info(f"Deleted empty tables: {', '.join(plan.tables)}")
+            finally:
+                db.close()
 
-                if 'projectinformation_id' not in column_names:
-                    try:
-                        logging.info(f"Adding ProjectInformation_id to {table_name} in source database")
-                        cursor.execute(f"ALTER TABLE '{table_name}' ADD COLUMN 'ProjectInformation_id' INTEGER")
-                        cursor.execute(f"UPDATE '{table_name}' SET ProjectInformation_id = ?", (existing_pi_id,))
-                        conn.commit()
-                    except sqlite3.OperationalError as e:
-                        logging.warning(f"Could not add ProjectInformation_id to {table_name}: {e}")
-                        # Continue with other tables
-
-            # STEP 4: Now create the relationships
+            # STEP 5: Rename IDs, create the relationships, add ProjectInformation_id and remove
+            # empty columns, with at most one rebuild per table
             logging.info("Creating relationships in source database")
-            conn.close()  # Close before using rename_id_columns_and_create_relations
-
-            # This function will open its own connection
             try:
-                # First identify potential relationships
-                matching_info = find_matching_table_column_names(self.source_db_path)
-
-                if matching_info and matching_info[1]:
-                    # Now create the relationships
-                    rename_id_columns_and_create_relations(self.source_db_path, matching_info[1])
+                rename_id_columns_and_create_relations(self.source_db_path, data_matches,
+                                                       project_id=existing_pi_id,
+                                                       dropped_columns=dropped_columns,
+                                                       stamp_existing=False)
+                if data_matches:
                     logging.info("Successfully created relationships in source database")
                 else:
                     logging.info("No potential relationships found in source database")
@@ -231,6 +241,12 @@ class DatabaseMerger:
             target_conn = sqlite3.connect(self.target_db_path)
             target_conn.execute("PRAGMA foreign_keys = ON")
             target_cursor = target_conn.cursor()
+
+            # Attach the source, so tables are merged inside SQLite with INSERT ... SELECT
+            self._source_attached = self._attach_source(target_conn)
+
+            # Every change to the target is made in one transaction, committed at the end
+            target_cursor.execute("BEGIN")
             
             # STEP 1: Get table list from source
             source_cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT IN ('sqlite_sequence')")
@@ -262,18 +278,72 @@ class DatabaseMerger:
             
             # STEP 6: Verify ProjectInformation_id values
             self._verify_pi_values(target_conn)
+
+            # STEP 7: Index foreign key and ProjectInformation_id columns of the merged tables
+            index_reports = create_relation_indexes(target_cursor)
+            target_conn.commit()
+            logging.info(f"Indexed {len(index_reports)} relation columns in target database")
             
             return True
             
         except Exception as e:
             logging.error(f"Error during direct merge: {e}", exc_info=True)
+            if target_conn:
+                target_conn.rollback()
             return False
             
         finally:
             if source_conn:
                 source_conn.close()
             if target_conn:
+                if self._source_attached:
+                    try:
+                        target_conn.rollback()
+                        target_conn.execute("DETACH DATABASE src")
+                    except sqlite3.Error as e:
+                        logging.warning(f"Could not detach source database: {e}")
+                    self._source_attached = False
                 target_conn.close()
+
+    def _attach_source(self, target_conn) -> bool:
+        """Attach the source database to the target connection as 'src'. Returns False if it cannot be attached."""
+        try:
+            target_conn.execute("ATTACH DATABASE ? AS src", (self.source_db_path,))
+            return True
+        except sqlite3.Error as e:
+            logging.warning(f"Could not attach source database, merging row by row: {e}")
+            return False
+
+    @staticmethod
+    def _project_id_expression(column_sql: str, id_mapping: dict) -> str:
+        """SQL expression that remaps a ProjectInformation_id column through id_mapping."""
+        remapped = [(old_id, new_id) for old_id, new_id in id_mapping.items() if old_id != new_id]
+        if not remapped:
+            return column_sql
+        cases = " ".join(f"WHEN {int(old_id)} THEN {int(new_id)}" for old_id, new_id in remapped)
+        return f"CASE {column_sql} {cases} ELSE {column_sql} END"
+
+    def _insert_from_source(self, target_cursor, table_name, column_names, id_mapping, or_ignore=False) -> int:
+        """
+        Copy the given columns of a source table in one INSERT ... SELECT over the attached source.
+
+        ProjectInformation_id is remapped by a CASE expression, so no row passes
+        through Python. Returns the number of rows inserted.
+        """
+        select_columns = []
+        for col in column_names:
+            if col.lower() == 'projectinformation_id':
+                select_columns.append(self._project_id_expression(f's."{col}"', id_mapping))
+            else:
+                select_columns.append(f's."{col}"')
+
+        columns_sql = ', '.join([f'"{col}"' for col in column_names])
+        target_cursor.execute(f'''
+            INSERT {"OR IGNORE " if or_ignore else ""}INTO main."{table_name}" ({columns_sql})
+            SELECT {", ".join(select_columns)}
+            FROM src."{table_name}" s
+        ''')
+        return target_cursor.rowcount
     
     def _merge_project_information(self, source_conn, target_conn) -> dict:
         """Merge ProjectInformation tables with guaranteed ID preservation"""
@@ -361,7 +431,6 @@ class DatabaseMerger:
                 logging.info(f"Preserved source ProjectInformation_id {source_id}")
                 existing_ids.add(source_id)  # Mark as used
         
-        target_conn.commit()
         return id_mapping
     
     def _merge_table(self, source_conn, target_conn, table_name, id_mapping):
@@ -403,9 +472,17 @@ class DatabaseMerger:
                     # Column might already exist
                     pass
             
+            if self._source_attached:
+                try:
+                    merged = self._insert_from_source(target_cursor, table_name, common_columns, id_mapping, or_ignore=True)
+                    logging.info(f"Merged {merged} rows into table {table_name}")
+                    return
+                except sqlite3.OperationalError as e:
+                    # A failed statement inserts nothing, so the row by row path starts clean
+                    logging.warning(f"In-engine merge of {table_name} failed, merging row by row: {e}")
+
             # Get source data
             source_cursor.execute(f"SELECT {', '.join(['\"' + col + '\"' for col in common_columns])} FROM '{table_name}'")
-            rows = source_cursor.fetchall()
             
             # Find PI column index
             pi_index = None
@@ -418,23 +495,13 @@ class DatabaseMerger:
             columns_sql = ', '.join([f'"{col}"' for col in common_columns])
             placeholders = ', '.join(['?'] * len(common_columns))
             
-            # Process and insert each row
-            for row in rows:
-                # Apply ID mapping if needed
-                row_list = list(row)
-                if pi_index is not None and row_list[pi_index] is not None:
-                    old_id = row_list[pi_index]
-                    new_id = id_mapping.get(old_id, old_id)  # Use mapping or original
-                    row_list[pi_index] = new_id
-                
-                # Insert with OR IGNORE to handle duplicates
-                target_cursor.execute(f'''
-                    INSERT OR IGNORE INTO "{table_name}" ({columns_sql})
-                    VALUES ({placeholders})
-                ''', row_list)
+            # Insert with OR IGNORE to handle duplicates, streaming the rows in batches
+            row_count = self._stream_rows(source_cursor, target_cursor, f'''
+                INSERT OR IGNORE INTO "{table_name}" ({columns_sql})
+                VALUES ({placeholders})
+            ''', pi_index, id_mapping)
             
-            target_conn.commit()
-            logging.info(f"Merged {len(rows)} rows into table {table_name}")
+            logging.info(f"Merged {row_count} rows into table {table_name}")
             
         except Exception as e:
             target_conn.rollback()
@@ -465,8 +532,16 @@ class DatabaseMerger:
             
             # Get data with column names
             column_names = [col[1] for col in columns]
+
+            if self._source_attached:
+                try:
+                    copied = self._insert_from_source(target_cursor, table_name, column_names, id_mapping)
+                    logging.info(f"Copied table {table_name} with {copied} rows")
+                    return
+                except sqlite3.OperationalError as e:
+                    # A failed statement inserts nothing, so the row by row path starts clean
+                    logging.warning(f"In-engine copy of {table_name} failed, copying row by row: {e}")
             source_cursor.execute(f"SELECT {', '.join(['\"' + col + '\"' for col in column_names])} FROM '{table_name}'")
-            rows = source_cursor.fetchall()
             
             # Find PI column index
             pi_index = None
@@ -479,27 +554,42 @@ class DatabaseMerger:
             columns_sql = ', '.join([f'"{col}"' for col in column_names])
             placeholders = ', '.join(['?'] * len(column_names))
             
-            for row in rows:
-                # Apply ID mapping if needed
-                row_list = list(row)
-                if pi_index is not None and row_list[pi_index] is not None:
-                    old_id = row_list[pi_index]
-                    new_id = id_mapping.get(old_id, old_id)  # Use mapping or original
-                    row_list[pi_index] = new_id
-                
-                target_cursor.execute(f'''
-                    INSERT INTO "{table_name}" ({columns_sql})
-                    VALUES ({placeholders})
-                ''', row_list)
+            row_count = self._stream_rows(source_cursor, target_cursor, f'''
+                INSERT INTO "{table_name}" ({columns_sql})
+                VALUES ({placeholders})
+            ''', pi_index, id_mapping)
             
-            target_conn.commit()
-            logging.info(f"Copied table {table_name} with {len(rows)} rows")
+            logging.info(f"Copied table {table_name} with {row_count} rows")
             
         except Exception as e:
             target_conn.rollback()
             logging.error(f"Error copying table {table_name}: {e}")
             raise
     
+    def _stream_rows(self, source_cursor, target_cursor, insert_sql, pi_index, id_mapping) -> int:
+        """
+        Insert the rows of an executed source query into the target, batch_size rows at a time.
+
+        ProjectInformation_id at pi_index is remapped on the way. Only one batch
+        is held in memory at any time. Returns the number of rows read.
+        """
+        row_count = 0
+
+        def mapped_rows():
+            nonlocal row_count
+            for row in iter_rows(source_cursor, self.batch_size):
+                row_count += 1
+                # Apply ID mapping if needed
+                if pi_index is not None and row[pi_index] is not None:
+                    row_list = list(row)
+                    row_list[pi_index] = id_mapping.get(row_list[pi_index], row_list[pi_index])  # Use mapping or original
+                    row = tuple(row_list)
+                yield row
+
+        for batch in iter_batches(mapped_rows(), self.batch_size):
+            target_cursor.executemany(insert_sql, batch)
+        return row_count
+
     def _ensure_all_pi_columns(self, target_conn):
         """Ensure all tables have ProjectInformation_id column after merge"""
         cursor = target_conn.cursor()
@@ -519,13 +609,10 @@ class DatabaseMerger:
             
             if 'projectinformation_id' not in columns:
                 try:
-                    cursor.execute(f"ALTER TABLE '{table_name}' ADD COLUMN 'ProjectInformation_id' INTEGER")
-                    cursor.execute(f"UPDATE '{table_name}' SET ProjectInformation_id = ?", (default_id,))
+                    add_project_column(cursor, table_name, default_id)
                     logging.info(f"Added ProjectInformation_id to {table_name} after merge")
                 except:
                     logging.warning(f"Could not add ProjectInformation_id to {table_name}")
-        
-        target_conn.commit()
     
     def _create_relations(self, target_conn):
         """
@@ -535,6 +622,7 @@ class DatabaseMerger:
         cursor = target_conn.cursor()
         
         # STEP 1: First disable foreign keys temporarily
+        # (no effect inside the merge transaction, where the values set below are valid references anyway)
         cursor.execute("PRAGMA foreign_keys = OFF")
         
         # STEP 2: Ensure all tables have the column before trying to create relations
@@ -557,7 +645,7 @@ class DatabaseMerger:
                 
                 # Add column if missing
                 if 'projectinformation_id' not in column_names:
-                    cursor.execute(f"ALTER TABLE '{table_name}' ADD COLUMN 'ProjectInformation_id' INTEGER")
+                    add_project_column(cursor, table_name, default_id)
                     modified_tables += 1
                     
                 # Fix invalid values
@@ -588,8 +676,6 @@ class DatabaseMerger:
             except Exception as e:
                 logging.warning(f"Could not update {table_name}: {e}")
                 
-        # Commit the changes
-        target_conn.commit()
         cursor.execute("PRAGMA foreign_keys = ON")
         
         logging.info("Data consistency ensured for all tables")
@@ -1,41 +1,20 @@
 from ..db_connection import DatabaseConnection
-from ..db_utils import delete_empty_tables, delete_empty_columns
+from ..cleanup_utils import CleanupReport, run_cleanup
 import sqlite3
 import logging
 
 class DatabaseCleaner:
     @staticmethod
-    def cleanup_database(db_path: str) -> None:
-        """Database cleanup logic"""
-        db = None
+    def cleanup_database(db_path: str, reclaim: bool = False) -> CleanupReport:
+        """Drop empty tables and columns, planned first and applied in one transaction"""
         try:
-            db = DatabaseConnection(db_path)
-            
-            # Delete empty tables
-            deleted_tables = delete_empty_tables(db_path)
-            if deleted_tables:
-                logging.info(f"Deleted empty tables: {', '.join(deleted_tables)}")
-            
-            # Clean columns in remaining tables
-            db.cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            for table in db.cursor.fetchall():
-                table_name = table[0]
-                if table_name != 'sqlite_sequence':
-                    delete_empty_columns(db_path, table_name)
-                    
-            db.commit()
-            
+            report = run_cleanup(db_path, reclaim)
+            if report.dropped_tables:
+                logging.info(f"Deleted empty tables: {', '.join(report.dropped_tables)}")
+            return report
         except Exception as e:
-            if db:
-                db.rollback()
             logging.error(f"Error during cleanup: {e}")
             raise
-        finally:
-            if db:
-                try:
-                    db.close()
-                except:
-                    pass
 
     @staticmethod
     def cleanup_temp_tables(db: DatabaseConnection) -> None:
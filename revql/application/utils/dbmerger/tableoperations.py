@@ -1,13 +1,39 @@
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple
 from ..db_connection import DatabaseConnection
 import sqlite3
 import logging
 import time
 
+# Rows fetched from the source and written to the target per batch when copying tables
+COPY_BATCH_SIZE = 1000
+
+def iter_rows(cursor, batch_size: int = COPY_BATCH_SIZE) -> Iterator[tuple]:
+    """Yield the rows of an executed query, fetching batch_size rows at a time."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+def iter_batches(rows, batch_size: int = COPY_BATCH_SIZE) -> Iterator[List[tuple]]:
+    """Group an iterable of rows into lists of at most batch_size rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 def build_insert_statement(table_name, source_db, target_db, available_columns, 
-                        target_columns, source_columns, id_mapping, target_pi_name=None):
+                        target_columns, source_columns, id_mapping, target_pi_name=None,
+                        batch_size: int = COPY_BATCH_SIZE):
     """
     Build INSERT statement for merged table with proper handling of ProjectInformation_id.
+
+    The rows are returned as a generator that reads the source batch_size rows
+    at a time, so the table is never held in memory as a whole.
     """
     # Get column positions from source table
     source_db.cursor.execute(f'PRAGMA table_info("{table_name}")')
@@ -41,13 +67,12 @@ def build_insert_statement(table_name, source_db, target_db, available_columns,
     # Create INSERT OR IGNORE statement to avoid duplicates
     insert_sql = f'INSERT OR IGNORE INTO "{table_name}" ({columns_sql}) VALUES ({placeholders})'
     
-    # Get data from source table
-    source_db.cursor.execute(f'SELECT * FROM "{table_name}"')
-    rows = source_db.cursor.fetchall()
+    # Get data from source table, on its own cursor so it can be read while streaming
+    source_cursor = source_db.connection.cursor()
+    source_cursor.execute(f'SELECT * FROM "{table_name}"')
     
     # Process data for insertion
-    batch_data = []
-    for row in rows:
+    def map_row(row):
         values = []
         for col_lower in available_columns:
             pos = source_column_positions.get(col_lower)
@@ -62,9 +87,9 @@ def build_insert_statement(table_name, source_db, target_db, available_columns,
                     values.append(val)
             else:
                 values.append(None)
-        
-        batch_data.append(tuple(values))
+        return tuple(values)
     
+    batch_data = (map_row(row) for row in iter_rows(source_cursor, batch_size))
     return insert_sql, batch_data
 
 class TableOperations:
@@ -73,9 +98,12 @@ class TableOperations:
     
     @staticmethod
     def copy_table(source_db: DatabaseConnection, target_db: DatabaseConnection, 
-               table_name: str, columns: List[tuple], id_mapping: Dict[int, int]) -> None:
+               table_name: str, columns: List[tuple], id_mapping: Dict[int, int],
+               batch_size: int = COPY_BATCH_SIZE) -> None:
         """
         Copy a table from the source database to the target database.
+
+        Rows are streamed batch_size at a time, so memory use does not grow with the table.
         """
         temp_name = f"{table_name}_temp_{int(time.time())}"
 
@@ -131,84 +159,79 @@ class TableOperations:
             source_db.cursor.execute(f'PRAGMA table_info("{table_name}")')
             source_columns = {col[1].lower(): (i, col[1]) for i, col in enumerate(source_db.cursor.fetchall())}
 
-            source_db.cursor.execute(f'SELECT * FROM "{table_name}"')
-            rows = source_db.cursor.fetchall()
+            # Default ProjectInformation_id for sources without the column, looked up once
+            default_pi_value = None
+            if has_project_info_id and 'projectinformation_id' not in source_columns:
+                target_db.cursor.execute('''
+                    SELECT "ProjectInformation_id" 
+                    FROM "ProjectInformation" 
+                    ORDER BY "ProjectInformation_id" DESC 
+                    LIMIT 1
+                ''')
+                result = target_db.cursor.fetchone()
+                default_pi_value = result[0] if result else 1
+
+            source_cursor = source_db.connection.cursor()
+            source_cursor.execute(f'SELECT * FROM "{table_name}"')
 
             # Prepare data with ProjectInformation_id mapping
-            prepared_data = []
-
-            for row in rows:
-                # Convert row to list for modification
-                row_list = list(row)
-                values = []
-
-                # Check for ProjectInformation_id in source
-                pi_value = None
-                pi_found = False
-
-                if has_project_info_id and 'projectinformation_id' in source_columns:
-                    pi_idx, _ = source_columns['projectinformation_id']
-                    if pi_idx < len(row_list):
-                        pi_found = True
-                        old_id = row_list[pi_idx]
-                        # CRITICAL FIX: Only map if old_id is in the mapping AND has a different mapping
-                        if old_id in id_mapping and id_mapping[old_id] != old_id:
-                            pi_value = id_mapping[old_id]
-                        else:
-                            pi_value = old_id  # Preserve original ID
+            def prepare_rows():
+                for row in iter_rows(source_cursor, batch_size):
+                    # Convert row to list for modification
+                    row_list = list(row)
+                    values = []
+
+                    # Check for ProjectInformation_id in source
+                    pi_value = None
+                    pi_found = False
+
+                    if has_project_info_id and 'projectinformation_id' in source_columns:
+                        pi_idx, _ = source_columns['projectinformation_id']
+                        if pi_idx < len(row_list):
+                            pi_found = True
+                            old_id = row_list[pi_idx]
+                            # CRITICAL FIX: Only map if old_id is in the mapping AND has a different mapping
+                            if old_id in id_mapping and id_mapping[old_id] != old_id:
+                                pi_value = id_mapping[old_id]
+                            else:
+                                pi_value = old_id  # Preserve original ID
 
-                # Build new row values matching the target schema
-                for i, col in enumerate(columns):
-                    col_name = col[1]
-                    col_lower = col_name.lower()
+                    # Build new row values matching the target schema
+                    for i, col in enumerate(columns):
+                        col_name = col[1]
+                        col_lower = col_name.lower()
 
-                    # Skip duplicate or processed columns
-                    if col_lower not in processed_cols:
-                        continue
+                        # Skip duplicate or processed columns
+                        if col_lower not in processed_cols:
+                            continue
                     
-                    # Handle ProjectInformation_id specially
-                    if col_lower == 'projectinformation_id':
-                        if pi_found:
-                            values.append(pi_value)
+                        # Handle ProjectInformation_id specially
+                        if col_lower == 'projectinformation_id':
+                            if pi_found:
+                                values.append(pi_value)
+                            else:
+                                values.append(default_pi_value)
                         else:
-                            # Get default ProjectInformation_id if we need one
-                            if pi_value is None:
-                                target_db.cursor.execute('''
-                                    SELECT "ProjectInformation_id" 
-                                    FROM "ProjectInformation" 
-                                    ORDER BY "ProjectInformation_id" DESC 
-                                    LIMIT 1
-                                ''')
-                                result = target_db.cursor.fetchone()
-                                pi_value = result[0] if result else 1
-                            values.append(pi_value)
-                    else:
-                        # Get value from source if column exists there
-                        if col_lower in source_columns:
-                            idx, _ = source_columns[col_lower]
-                            if idx < len(row_list):
-                                values.append(row_list[idx])
+                            # Get value from source if column exists there
+                            if col_lower in source_columns:
+                                idx, _ = source_columns[col_lower]
+                                if idx < len(row_list):
+                                    values.append(row_list[idx])
+                                else:
+                                    values.append(None)
                             else:
                                 values.append(None)
-                        else:
-                            values.append(None)
 
-                # Ensure values list matches columns list in length
-                if len(values) == len(col_names):
-                    prepared_data.append(tuple(values))
+                    # Ensure values list matches columns list in length
+                    if len(values) == len(col_names):
+                        yield tuple(values)
 
-            # Insert data into temporary table in the target database
-            if prepared_data:
-                placeholders = ', '.join('?' for _ in range(len(col_names)))
-                insert_sql = f'INSERT INTO "{temp_name}" ({", ".join(col_names)}) VALUES ({placeholders})'
-
-                # Break into smaller batches to avoid SQLite limits
-                batch_size = 500
-                for i in range(0, len(prepared_data), batch_size):
-                    batch = prepared_data[i:i+batch_size]
-                    target_db.cursor.executemany(insert_sql, batch)
-
-                target_db.commit()
+            # Insert data into temporary table in the target database, one batch at a time
+            placeholders = ', '.join('?' for _ in range(len(col_names)))
+            insert_sql = f'INSERT INTO "{temp_name}" ({", ".join(col_names)}) VALUES ({placeholders})'
+            for batch in iter_batches(prepare_rows(), batch_size):
+                target_db.cursor.executemany(insert_sql, batch)
+            target_db.commit()
 
             # Replace original table with the temporary one
             target_db.cursor.execute(f'DROP TABLE IF EXISTS "{table_name}"')
@@ -230,8 +253,9 @@ class TableOperations:
     # FIX: Corrected indentation - this method was incorrectly indented inside copy_table
     @staticmethod
     def merge_existing_table(source_db: DatabaseConnection, target_db: DatabaseConnection, 
-                             table_name: str, columns: List[tuple], id_mapping: Dict[int, int]) -> None:
-        """Merge table logic handling duplicate columns and adding missing columns"""
+                             table_name: str, columns: List[tuple], id_mapping: Dict[int, int],
+                             batch_size: int = COPY_BATCH_SIZE) -> None:
+        """Merge table logic handling duplicate columns and adding missing columns, streaming batch_size rows at a time"""
         try:
             logging.info(f"Merging existing table {table_name}")
 
@@ -319,11 +343,12 @@ class TableOperations:
             insert_sql, batch_data = build_insert_statement(
                 table_name, source_db, target_db, available_columns, 
                 target_columns, source_columns, id_mapping,
-                target_project_info_id_name
+                target_project_info_id_name, batch_size
             )
 
             try:
-                target_db.cursor.executemany(insert_sql, batch_data)
+                for batch in iter_batches(batch_data, batch_size):
+                    target_db.cursor.executemany(insert_sql, batch)
                 target_db.commit()
                 logging.info(f"Successfully merged table {table_name}")
             except sqlite3.Error as e:
@@ -0,0 +1,154 @@
+import time
+import sqlite3
+import logging
+from typing import List, Optional
+from revql.application.utils.db_connection import DatabaseConnection
+
+# Prefix of the indexes created for relation columns; only these are ever dropped again
+RELATION_INDEX_PREFIX = "idx_rel_"
+
+PROJECT_COLUMN = "ProjectInformation_id"
+
+class IndexReport:
+    """An index built on a relation column, with its build time and size."""
+
+    def __init__(self, table_name: str, column_name: str, index_name: str, seconds: float, size: int):
+        self.table_name = table_name
+        self.column_name = column_name
+        self.index_name = index_name
+        self.seconds = seconds
+        self.size = size
+
+    def summary(self) -> str:
+        return (f"{self.index_name} on {self.table_name}.{self.column_name}: "
+                f"{self.seconds:.3f}s, {self.size / 1024:.1f} KB")
+
+def relation_index_name(table_name: str, column_name: str) -> str:
+    return f"{RELATION_INDEX_PREFIX}{table_name}_{column_name}"
+
+def get_relation_columns(cursor, table_name: str) -> List[str]:
+    """Foreign key columns of a table, followed by ProjectInformation_id if it has one."""
+    cursor.execute(f'PRAGMA foreign_key_list("{table_name}")')
+    columns = []
+    for row in cursor.fetchall():
+        if row[3] not in columns:
+            columns.append(row[3])
+
+    cursor.execute(f'PRAGMA table_info("{table_name}")')
+    for col in cursor.fetchall():
+        if col[1].lower() == PROJECT_COLUMN.lower() and col[1] not in columns:
+            columns.append(col[1])
+    return columns
+
+def has_leading_index(cursor, table_name: str, column_name: str) -> bool:
+    """Whether an index (or the rowid primary key) already starts with the column."""
+    cursor.execute(f'PRAGMA table_info("{table_name}")')
+    primary_keys = [col for col in cursor.fetchall() if col[5]]
+    if len(primary_keys) == 1 and primary_keys[0][1] == column_name and primary_keys[0][2].upper() == "INTEGER":
+        return True
+
+    cursor.execute(f'PRAGMA index_list("{table_name}")')
+    for index in cursor.fetchall():
+        if index[4]:
+            continue  # Partial indexes only cover some rows
+        cursor.execute(f'PRAGMA index_info("{index[1]}")')
+        index_columns = sorted(cursor.fetchall())
+        if index_columns and index_columns[0][2] == column_name:
+            return True
+    return False
+
+def get_index_size(cursor, index_name: str) -> Optional[int]:
+    """Size of an index in bytes, or None when SQLite is built without the dbstat table."""
+    try:
+        cursor.execute("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = ?", (index_name,))
+    except sqlite3.OperationalError:
+        return None
+    return cursor.fetchone()[0]
+
+def create_relation_indexes(cursor, table_names: Optional[List[str]] = None) -> List[IndexReport]:
+    """
+    Index every foreign key and ProjectInformation_id column that no index starts with yet.
+
+    Only the indexes actually created are reported; a column whose index name
+    is already taken is skipped with a warning.
+
+    Each entry also holds the row's rowid, which is the table's INTEGER primary key,
+    so joins and project filters that only need the key are answered from the index.
+    Without dbstat, the size is taken from the growth of the file in pages.
+    """
+    if table_names is None:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        table_names = [row[0] for row in cursor.fetchall() if not row[0].startswith('sqlite_')]
+
+    page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+    reports = []
+    for table_name in table_names:
+        for column_name in get_relation_columns(cursor, table_name):
+            if has_leading_index(cursor, table_name, column_name):
+                continue
+
+            index_name = relation_index_name(table_name, column_name)
+            cursor.execute("SELECT type, tbl_name FROM sqlite_master WHERE name = ? COLLATE NOCASE", (index_name,))
+            existing = cursor.fetchone()
+            if existing is not None:
+                # The name is taken by an object that does not index this column
+                logging.warning(f"Could not index {table_name}.{column_name}: "
+                                f"{existing[0]} {index_name} on {existing[1]} already exists")
+                continue
+
+            pages_before = cursor.execute("PRAGMA page_count").fetchone()[0]
+            started = time.perf_counter()
+            try:
+                cursor.execute(f'CREATE INDEX "{index_name}" ON "{table_name}" ("{column_name}")')
+            except sqlite3.OperationalError as e:
+                logging.warning(f"Could not index {table_name}.{column_name}: {e}")
+                continue
+            seconds = time.perf_counter() - started
+
+            size = get_index_size(cursor, index_name)
+            if size is None:
+                size = (cursor.execute("PRAGMA page_count").fetchone()[0] - pages_before) * page_size
+
+            report = IndexReport(table_name, column_name, index_name, seconds, size)
+            logging.info(f"Created index {report.summary()}")
+            reports.append(report)
+
+    return reports
+
+def drop_unused_indexes(cursor) -> List[str]:
+    """
+    Drop relation indexes that cannot narrow down any lookup.
+
+    An index whose column holds at most one distinct value, such as
+    ProjectInformation_id before a merge, is never chosen by the query planner
+    over a scan. Only indexes created by create_relation_indexes are considered.
+    """
+    cursor.execute("SELECT name, tbl_name FROM sqlite_master WHERE type='index' AND name LIKE ?",
+                   (f"{RELATION_INDEX_PREFIX}%",))
+    dropped = []
+    for index_name, table_name in cursor.fetchall():
+        cursor.execute(f'PRAGMA index_info("{index_name}")')
+        column_name = cursor.fetchone()[2]
+
+        # Reading two distinct values walks the index itself, so this stays cheap
+        cursor.execute(f'SELECT COUNT(*) FROM (SELECT DISTINCT "{column_name}" FROM "{table_name}" LIMIT 2)')
+        if cursor.fetchone()[0] <= 1:
+            cursor.execute(f'DROP INDEX "{index_name}"')
+            dropped.append(index_name)
+            logging.info(f"Dropped unused index {index_name}")
+
+    return dropped
+
+def drop_unused_relation_indexes(db_path: str) -> List[str]:
+    """Drop the relation indexes of a database that cannot narrow down any lookup."""
+    db = DatabaseConnection(db_path)
+    try:
+        db.cursor.execute("BEGIN")
+        dropped = drop_unused_indexes(db.cursor)
+        db.commit()
+        return dropped
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    finally:
+        db.close()
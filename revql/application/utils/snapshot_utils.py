@@ -0,0 +1,73 @@
+import os
+import glob
+import time
+import sqlite3
+import logging
+from typing import List, Optional
+
+# Pages copied per online backup step; the source is only locked while a step runs
+SNAPSHOT_STEP_PAGES = 1024
+
+# Snapshots kept per database by default, newest first
+DEFAULT_KEEP_SNAPSHOTS = 3
+
+def _snapshot_prefix(db_path: str, snapshot_dir: Optional[str] = None) -> str:
+    directory = snapshot_dir or os.path.dirname(os.path.abspath(db_path))
+    return os.path.join(directory, f"{os.path.basename(db_path)}.snapshot_")
+
+def list_snapshots(db_path: str, snapshot_dir: Optional[str] = None) -> List[str]:
+    """Snapshot files of a database, oldest first."""
+    prefix = _snapshot_prefix(db_path, snapshot_dir)
+    return sorted(glob.glob(f"{glob.escape(prefix)}*"))
+
+def create_snapshot(db_path: str, snapshot_dir: Optional[str] = None,
+                    step_pages: int = SNAPSHOT_STEP_PAGES) -> str:
+    """
+    Write a point-in-time copy of the database with SQLite's online backup API.
+
+    The copy is made step_pages pages at a time, so other connections can keep
+    using the database between steps. Returns the path of the snapshot.
+    """
+    if snapshot_dir:
+        os.makedirs(snapshot_dir, exist_ok=True)
+    # Millisecond timestamps keep the names unique and in creation order
+    snapshot_path = f"{_snapshot_prefix(db_path, snapshot_dir)}{int(time.time() * 1000)}"
+
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(snapshot_path)
+    try:
+        source.backup(target, pages=step_pages)
+    except sqlite3.Error:
+        target.close()
+        os.remove(snapshot_path)
+        raise
+    finally:
+        source.close()
+        target.close()
+
+    logging.info(f"Created snapshot of {db_path} at {snapshot_path}")
+    return snapshot_path
+
+def prune_snapshots(db_path: str, snapshot_dir: Optional[str] = None,
+                    keep: int = DEFAULT_KEEP_SNAPSHOTS) -> List[str]:
+    """Delete all but the newest keep snapshots of a database. Returns the deleted paths."""
+    snapshots = list_snapshots(db_path, snapshot_dir)
+    expired = snapshots[:-keep] if keep > 0 else snapshots
+    for path in expired:
+        try:
+            os.remove(path)
+            logging.info(f"Deleted expired snapshot {path}")
+        except OSError as e:
+            logging.warning(f"Could not delete snapshot {path}: {e}")
+    return expired
+
+def restore_snapshot(snapshot_path: str, db_path: str, step_pages: int = SNAPSHOT_STEP_PAGES) -> None:
+    """Copy a snapshot back over the database with the online backup API."""
+    source = sqlite3.connect(snapshot_path)
+    target = sqlite3.connect(db_path)
+    try:
+        source.backup(target, pages=step_pages)
+    finally:
+        source.close()
+        target.close()
+    logging.info(f"Restored {db_path} from snapshot {snapshot_path}")
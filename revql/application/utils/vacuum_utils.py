@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import logging
+from typing import Callable, Optional
+from revql.application.utils.db_connection import DatabaseConnection
+
+# Pages returned to the file system per incremental vacuum step (4 MB at the default page size)
+VACUUM_STEP_PAGES = 1024
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_NONE = 0
+AUTO_VACUUM_FULL = 1
+AUTO_VACUUM_INCREMENTAL = 2
+
+class VacuumReport:
+    """File size of a database before and after space was reclaimed."""
+
+    def __init__(self, size_before: int, size_after: int, completed: bool = True):
+        self.size_before = size_before
+        self.size_after = size_after
+        self.completed = completed
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return max(0, self.size_before - self.size_after)
+
+    def summary(self) -> str:
+        state = "" if self.completed else " (interrupted, run again to continue)"
+        return (f"File size {self.size_before / (1024 * 1024):.1f} MB -> {self.size_after / (1024 * 1024):.1f} MB, "
+                f"reclaimed {self.bytes_reclaimed / (1024 * 1024):.1f} MB{state}")
+
+def _file_size(db_path: str) -> int:
+    """Size of the database file, including a pending write-ahead log."""
+    size = os.path.getsize(db_path)
+    wal_path = f"{db_path}-wal"
+    return size + os.path.getsize(wal_path) if os.path.exists(wal_path) else size
+
+def enable_incremental_vacuum(db_path: str) -> bool:
+    """
+    Switch the database to auto_vacuum=INCREMENTAL. Returns True if it was switched.
+
+    Existing databases only pick up the new mode through one full VACUUM, which
+    is run here once; from then on freed pages can be returned in bounded steps.
+    """
+    db = DatabaseConnection(db_path)
+    try:
+        mode = db.cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode == AUTO_VACUUM_INCREMENTAL:
+            return False
+
+        logging.info("Switching database to incremental auto-vacuum (one full VACUUM)")
+        db.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        db.cursor.execute("VACUUM")
+        return True
+    finally:
+        db.close()
+
+def incremental_vacuum(db_path: str, step_pages: int = VACUUM_STEP_PAGES, max_steps: Optional[int] = None,
+                       should_stop: Optional[Callable[[], bool]] = None,
+                       on_step: Optional[Callable[[int, int], None]] = None) -> VacuumReport:
+    """
+    Return free pages to the file system in steps of step_pages, committing after each step.
+
+    Stops once no free pages remain, after max_steps steps, or as soon as
+    should_stop() returns True; an interrupted run leaves a consistent, partly
+    compacted file and can simply be resumed. After each step, on_step receives
+    the pages returned so far and the free pages there were at the start.
+    Requires auto_vacuum=INCREMENTAL.
+    """
+    size_before = _file_size(db_path)
+    db = DatabaseConnection(db_path)
+    try:
+        cursor = db.cursor
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            raise sqlite3.OperationalError("Incremental vacuum requires auto_vacuum=INCREMENTAL")
+
+        steps = 0
+        completed = True
+        total_pages = free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        while free_pages > 0:
+            if (max_steps is not None and steps >= max_steps) or (should_stop and should_stop()):
+                completed = False
+                break
+
+            # The pragma returns a row per freed page; it only runs as the rows are read
+            cursor.execute(f"PRAGMA incremental_vacuum({int(step_pages)})").fetchall()
+            db.commit()
+            steps += 1
+            free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            if on_step:
+                on_step(total_pages - free_pages, total_pages)
+    finally:
+        db.close()
+
+    report = VacuumReport(size_before, _file_size(db_path), completed)
+    logging.info(f"Incremental vacuum: {report.summary()}")
+    return report
+
+def reclaim_space(db_path: str, step_pages: int = VACUUM_STEP_PAGES, max_steps: Optional[int] = None,
+                  should_stop: Optional[Callable[[], bool]] = None,
+                  on_step: Optional[Callable[[int, int], None]] = None) -> VacuumReport:
+    """Reclaim the free pages of a database, switching it to incremental auto-vacuum first if needed."""
+    size_before = _file_size(db_path)
+    enable_incremental_vacuum(db_path)
+    report = incremental_vacuum(db_path, step_pages, max_steps, should_stop, on_step)
+    return VacuumReport(size_before, report.size_after, report.completed)
+
+def vacuum_into(db_path: str, target_path: str) -> VacuumReport:
+    """Write a compacted copy of the database to target_path with VACUUM INTO, leaving it untouched."""
+    if os.path.exists(target_path):
+        raise FileExistsError(f"Target file already exists: {target_path}")
+
+    size_before = _file_size(db_path)
+    db = DatabaseConnection(db_path)
+    try:
+        db.cursor.execute("VACUUM INTO ?", (target_path,))
+    finally:
+        db.close()
+
+    report = VacuumReport(size_before, _file_size(target_path))
+    logging.info(f"Compacted copy written to {target_path}: {report.summary()}")
+    return report